@@ -137,6 +137,10 @@ class Base(metaclass=MetaBase):
     def get_metadata(self, i):
         return self[i].metadata()
 
+    def _iter_lazy(self):
+        # Iterates without preparing the data of the elements, see Index.__iter__()
+        return iter(self)
+
     def unique_values(self, *coords, remapping=None, progress_bar=True):
         """
         Given a list of metadata attributes, such as date, param, levels,
@@ -147,11 +151,12 @@ class Base(metaclass=MetaBase):
         assert all(isinstance(k, str) for k in coords), coords
 
         remapping = build_remapping(remapping)
-        iterable = self
+        iterable = self._iter_lazy()
 
         if progress_bar:
             iterable = climetlab.utils.progress_bar(
-                iterable=self,
+                iterable=iterable,
+                total=len(self) if hasattr(self, "__len__") else None,
                 desc=f"Finding coords in dataset for {coords}",
             )
 
@@ -169,11 +174,12 @@ class Base(metaclass=MetaBase):
     def combinations(self, *coords, progress_bar=True):
         assert all(isinstance(k, str) for k in coords), coords
 
-        iterable = self
+        iterable = self._iter_lazy()
 
         if progress_bar:
             iterable = climetlab.utils.progress_bar(
-                iterable=self,
+                iterable=iterable,
+                total=len(self) if hasattr(self, "__len__") else None,
                 desc=f"Finding coords in dataset for {coords}",
             )
 
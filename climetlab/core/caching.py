@@ -633,6 +633,29 @@ settings_changed = in_executor(CACHE._settings_changed)
 cache_directory = in_executor(CACHE._cache_directory)
 
 
+def cache_file_path(owner: str, args, hash_extra=None, extension: str = ".cache"):
+    """Returns the path that :py:func:`cache_file` would use, without
+    registering or creating it."""
+
+    m = hashlib.sha256()
+    m.update(owner.encode("utf-8"))
+
+    m.update(
+        json.dumps(args, sort_keys=True, default=default_serialiser).encode("utf-8")
+    )
+    m.update(json.dumps(hash_extra, sort_keys=True).encode("utf-8"))
+    m.update(json.dumps(extension, sort_keys=True).encode("utf-8"))
+
+    return os.path.join(
+        SETTINGS.get("cache-directory"),
+        "{}-{}{}".format(
+            owner.lower(),
+            m.hexdigest(),
+            extension,
+        ),
+    )
+
+
 def cache_file(
     owner: str,
     create,
@@ -658,28 +681,12 @@ def cache_file(
         Full path to the cache file.
     """
 
-    m = hashlib.sha256()
-    m.update(owner.encode("utf-8"))
-
-    m.update(
-        json.dumps(args, sort_keys=True, default=default_serialiser).encode("utf-8")
-    )
-    m.update(json.dumps(hash_extra, sort_keys=True).encode("utf-8"))
-    m.update(json.dumps(extension, sort_keys=True).encode("utf-8"))
-
     if replace is not None:
         # Don't replace files that are not in the cache
         if not file_in_cache_directory(replace):
             replace = None
 
-    path = os.path.join(
-        SETTINGS.get("cache-directory"),
-        "{}-{}{}".format(
-            owner.lower(),
-            m.hexdigest(),
-            extension,
-        ),
-    )
+    path = cache_file_path(owner, args, hash_extra=hash_extra, extension=extension)
 
     record = register_cache_file(path, owner, args)
     if os.path.exists(path):
@@ -715,6 +722,19 @@ def cache_file(
     return path
 
 
+def auxiliary_cache_args(path, index=0):
+    # Arguments identifying the auxiliary cache files of `path`,
+    # they change if `path` is changed
+    stat = os.stat(path)
+    return (
+        path,
+        stat.st_ctime,
+        stat.st_mtime,
+        stat.st_size,
+        index,
+    )
+
+
 def auxiliary_cache_file(
     owner,
     path,
@@ -724,9 +744,6 @@ def auxiliary_cache_file(
 ):
     # Create an auxiliary cache file
     # to be used for example to cache an index
-    # It is invalidated if `path` is changed
-    stat = os.stat(path)
-
     def create(target, args):
         # Simply touch the file
         with open(target, "w") as f:
@@ -736,16 +753,17 @@ def auxiliary_cache_file(
     return cache_file(
         owner,
         create,
-        (
-            path,
-            stat.st_ctime,
-            stat.st_mtime,
-            stat.st_size,
-            index,
-        ),
+        auxiliary_cache_args(path, index),
         extension=extension,
     )
 
 
+def auxiliary_cache_file_path(owner, path, index=0, extension=".cache"):
+    # Path of an auxiliary cache file, which may not exist
+    return cache_file_path(
+        owner, auxiliary_cache_args(path, index), extension=extension
+    )
+
+
 # housekeeping()
 SETTINGS.on_change(settings_changed)
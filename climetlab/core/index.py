@@ -8,7 +8,9 @@
 #
 
 
+import bisect
 import functools
+import itertools
 import logging
 import math
 from abc import abstractmethod
@@ -17,6 +19,8 @@ from collections import defaultdict
 import climetlab as cml
 from climetlab.core.order import normalize_order_by
 from climetlab.core.select import normalize_selection
+from climetlab.core.settings import SETTINGS
+from climetlab.core.thread import ordered_map
 from climetlab.loaders import build_remapping
 from climetlab.sources import Source
 
@@ -155,6 +159,8 @@ class Order(OrderBase):
 
 
 class Index(Source):
+    _metadata_table = None
+
     @classmethod
     def new_mask_index(self, *args, **kwargs):
         return MaskIndex(*args, **kwargs)
@@ -193,13 +199,18 @@ class Index(Source):
         if not kwargs:
             return self
 
+        if remapping is None and self._metadata_table is not None:
+            return self._mask(self._metadata_table.select(kwargs).tolist())
+
         selection = Selection(kwargs, remapping=remapping)
 
         indices = (
-            i for i, element in enumerate(self) if selection.match_element(element)
+            i
+            for i, element in enumerate(self._iter_lazy())
+            if selection.match_element(element)
         )
 
-        return self.new_mask_index(self, indices)
+        return self._mask(indices)
 
     def order_by(self, *args, remapping=None, **kwargs):
         """Default order_by method.
@@ -212,11 +223,16 @@ class Index(Source):
         kwargs = normalize_order_by(*args, **kwargs)
         kwargs = self._normalize_kwargs_names(**kwargs)
 
-        remapping = build_remapping(remapping)
-
         if not kwargs:
             return self
 
+        if remapping is None and self._metadata_table is not None:
+            indices = self._metadata_table.order(kwargs)
+            if indices is not None:
+                return self._mask(indices.tolist())
+
+        remapping = build_remapping(remapping)
+
         order = Order(kwargs, remapping=remapping)
 
         def cmp(i, j):
@@ -224,7 +240,76 @@ class Index(Source):
 
         indices = list(range(len(self)))
         indices = sorted(indices, key=functools.cmp_to_key(cmp))
-        return self.new_mask_index(self, indices)
+        return self._mask(indices)
+
+    def isel(self, *args, **kwargs):
+        """Like sel(), but using the positions of the values in the
+        result of unique_values(), e.g. isel(param=0) or isel(level=[0, 2]).
+        Returns a new index object.
+        """
+        for a in args:
+            kwargs.update(a)
+        kwargs = self._normalize_kwargs_names(**kwargs)
+        if not kwargs:
+            return self
+
+        unique = self.unique_values(*kwargs.keys(), progress_bar=False)
+
+        selection = {}
+        for k, v in kwargs.items():
+            values = unique[k]
+            if isinstance(v, slice):
+                selection[k] = list(values[v])
+            elif isinstance(v, (list, tuple)):
+                selection[k] = [values[i] for i in v]
+            else:
+                selection[k] = values[v]
+
+        return self.sel(**selection)
+
+    def cache_metadata(self, *keys, progress_bar=True):
+        """Load the metadata `keys` of all the elements once into a columnar
+        table (see :py:class:`climetlab.core.table.MetadataTable`). Afterwards,
+        sel(), isel(), order_by() and unique_values() are vectorised operations
+        on that table, and so are they on the indexes they return.
+        Other keys are added to the table when first used.
+        Returns the index itself.
+        """
+        from climetlab.core.table import MetadataTable
+
+        if self._metadata_table is None:
+            self._metadata_table = MetadataTable(self, progress_bar=progress_bar)
+        self._metadata_table.load(*keys)
+        return self
+
+    def unique_values(self, *coords, remapping=None, progress_bar=True):
+        if remapping is None and self._metadata_table is not None:
+            return self._metadata_table.unique_values(*coords)
+        return super().unique_values(
+            *coords, remapping=remapping, progress_bar=progress_bar
+        )
+
+    def _mask(self, indices):
+        result = self.new_mask_index(self, indices)
+        if self._metadata_table is not None:
+            result._metadata_table = self._metadata_table.take(result.indices, result)
+        return result
+
+    def __iter__(self):
+        # With number-of-decode-threads > 1, the next elements are
+        # prepared by _prefetch() in threads, in order
+        nthreads = min(SETTINGS.get("number-of-decode-threads"), len(self))
+        if nthreads < 2:
+            return self._iter_lazy()
+        return ordered_map(self._prefetch, range(len(self)), nthreads)
+
+    def _prefetch(self, n):
+        return self[n]
+
+    def _iter_lazy(self):
+        # For loops that only need the metadata of the elements
+        for i in range(len(self)):
+            yield self[i]
 
     def __getitem__(self, n):
         if isinstance(n, slice):
@@ -239,14 +324,14 @@ class Index(Source):
 
     def from_slice(self, s):
         indices = range(len(self))[s]
-        return self.new_mask_index(self, indices)
+        return self._mask(indices)
 
     def from_mask(self, lst):
         indices = [i for i, x in enumerate(lst) if x]
-        return self.new_mask_index(self, indices)
+        return self._mask(indices)
 
     def from_tuple(self, lst):
-        return self.new_mask_index(self, lst)
+        return self._mask(lst)
 
     def from_dict(self, dic):
         return self.sel(dic)
@@ -257,9 +342,28 @@ class Index(Source):
         return MultiIndex(sources)
 
     def to_numpy(self, *args, **kwargs):
+        """Decode all the elements into one array of shape (len(self), *shape).
+        The result is allocated once, in the requested dtype, and filled in place.
+        """
         import numpy as np
 
-        return np.array([f.to_numpy(*args, **kwargs) for f in self])
+        n = len(self)
+        if n == 0:
+            return np.array([])
+
+        first = self[0].to_numpy(*args, **kwargs)
+        result = np.empty((n,) + first.shape, dtype=first.dtype)
+        result[0] = first
+        del first
+
+        def fill(i):
+            result[i] = self[i].to_numpy(*args, **kwargs)
+
+        nthreads = min(SETTINGS.get("number-of-decode-threads"), n - 1)
+        for _ in ordered_map(fill, range(1, n), nthreads):
+            pass
+
+        return result
 
     def to_pytorch_tensor(self, *args, **kwargs):
         import torch
@@ -292,26 +396,58 @@ class MaskIndex(Index):
 
 
 class MultiIndex(Index):
+    # The cumulative lengths of the sub-indexes are computed once, so that
+    # elements are located by bisection. Sub-indexes are expected to keep
+    # their length; assigning `indexes` resets the offsets, and code that
+    # changes the length of a sub-index must call _reset_offsets().
+    _offsets = None
+
     def __init__(self, indexes, *args, **kwargs):
         self.indexes = list(indexes)
         super().__init__(*args, **kwargs)
+
+    @property
+    def indexes(self):
+        return self._indexes
+
+    @indexes.setter
+    def indexes(self, indexes):
+        self._indexes = indexes
+        self._reset_offsets()
+
+    def _reset_offsets(self):
+        self._offsets = None
+
+    @property
+    def offsets(self):
+        # offsets[k] is the position of the first element of indexes[k],
+        # the last entry is the total length
+        if self._offsets is None:
+            self._offsets = [0] + list(
+                itertools.accumulate(len(i) for i in self.indexes)
+            )
+        return self._offsets
         # self.indexes = list(i for i in indexes if len(i))
         # TODO: propagate  index._init_args, index._init_order_by, index._init_kwargs, for each i in indexes?
 
     def sel(self, *args, **kwargs):
         if not args and not kwargs:
             return self
+        if self._metadata_table is not None:
+            return super().sel(*args, **kwargs)
         return self.__class__(i.sel(*args, **kwargs) for i in self.indexes)
 
     def _getitem(self, n):
-        k = 0
-        while n >= len(self.indexes[k]):
-            n -= len(self.indexes[k])
-            k += 1
-        return self.indexes[k][n]
+        offsets = self.offsets
+        if n < 0:
+            n += offsets[-1]
+        if not 0 <= n < offsets[-1]:
+            raise IndexError(n)
+        k = bisect.bisect_right(offsets, n) - 1
+        return self.indexes[k][n - offsets[k]]
 
     def __len__(self):
-        return sum(len(i) for i in self.indexes)
+        return self.offsets[-1]
 
     def graph(self, depth=0):
         print(" " * depth, self.__class__.__name__)
@@ -345,16 +481,20 @@ class FullIndex(Index):
         self.shape = shape
         self.holes = np.full(shape, False)
 
-        for f in index:
+        for f in index._iter_lazy():
             idx = tuple(name_to_index[k][f.metadata(k)] for k in coords)
             self.holes[idx] = True
 
         self.holes = self.holes.flatten()
-        print("+++++++++", self.holes.shape, coords, self.shape)
+        LOG.debug("FullIndex %s %s %s", self.holes.shape, coords, self.shape)
+
+        # Prefix sum: number of elements present before each position,
+        # i.e. the position of the element in the underlying index
+        self.positions = np.cumsum(self.holes) - self.holes
 
     def __len__(self):
         return self.size
 
     def _getitem(self, n):
         assert self.holes[n], f"Attempting to access hole {n}"
-        return self.index[sum(self.holes[:n])]
+        return self.index[int(self.positions[n])]
@@ -98,6 +98,17 @@ SETTINGS_AND_HELP = {
         5,
         """Number of threads used to download data.""",
     ),
+    "number-of-scan-threads": _(
+        1,
+        """Number of threads used to build the message indexes of GRIB files
+        when many files are opened together (e.g. a directory). Use 1 to scan them one by one.""",
+    ),
+    "number-of-decode-threads": _(
+        1,
+        """Number of threads used to decode fields in ``to_numpy()``, ``to_xarray()``,
+        when iterating over a fieldset and when loading data with ``climetlab create``.
+        The order of the fields is preserved.""",
+    ),
     "maximum-cache-size": _(
         None,
         """Maximum disk space used by the CliMetLab cache (ex: 100G or 2T).""",
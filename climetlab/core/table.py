@@ -0,0 +1,195 @@
+# (C) Copyright 2023 ECMWF.
+#
+# This software is licensed under the terms of the Apache Licence Version 2.0
+# which can be obtained at http://www.apache.org/licenses/LICENSE-2.0.
+# In applying this licence, ECMWF does not waive the privileges and immunities
+# granted to it by virtue of its status as an intergovernmental organisation
+# nor does it submit to any jurisdiction.
+#
+
+import logging
+
+import numpy as np
+
+import climetlab as cml
+from climetlab.utils import progress_bar
+
+LOG = logging.getLogger(__name__)
+
+
+def _to_column(values):
+    if any(v is None for v in values):
+        column = np.empty(len(values), dtype=object)
+        column[:] = values
+        return column
+
+    column = np.asarray(values)
+    if column.ndim != 1:
+        # e.g. values that are lists
+        column = np.empty(len(values), dtype=object)
+        column[:] = values
+    return column
+
+
+def _ranks(column):
+    # Position of each value in the sorted unique values
+    if column.dtype == object:
+        unique = sorted(set(column))
+        order = {v: i for i, v in enumerate(unique)}
+        return np.fromiter(
+            (order[v] for v in column), dtype=np.int64, count=len(column)
+        )
+    return np.unique(column, return_inverse=True)[1].reshape(-1)
+
+
+class MetadataTable:
+    """Columnar copy of the metadata of the elements of an index,
+    with one numpy array per key. Columns are loaded on first use,
+    with one pass over the elements for all the missing keys.
+    """
+
+    def __init__(self, index, columns=None, progress_bar=True):
+        self.index = index
+        self.columns = {} if columns is None else columns
+        self.progress_bar = progress_bar
+
+    def __len__(self):
+        return len(self.index)
+
+    def load(self, *keys):
+        missing = [k for k in keys if k not in self.columns]
+        if not missing:
+            return
+
+        iterable = self.index._iter_lazy()
+        if self.progress_bar:
+            iterable = progress_bar(
+                iterable=iterable,
+                total=len(self.index),
+                desc=f"Loading metadata {missing}",
+            )
+
+        values = {k: [] for k in missing}
+        for element in iterable:
+            for k in missing:
+                values[k].append(element.metadata(k))
+
+        for k in missing:
+            self.columns[k] = _to_column(values[k])
+
+    def column(self, key):
+        self.load(key)
+        return self.columns[key]
+
+    def take(self, indices, index):
+        indices = np.asarray(indices, dtype=np.int64)
+        return MetadataTable(
+            index,
+            {k: v[indices] for k, v in self.columns.items()},
+            progress_bar=self.progress_bar,
+        )
+
+    def select(self, kwargs):
+        """Returns the positions of the elements matching `kwargs`, with the
+        same semantics as :py:class:`climetlab.core.index.Selection`."""
+        self.load(*kwargs.keys())
+
+        mask = np.full(len(self), True)
+        for k, v in kwargs.items():
+            if v is None or v is cml.ALL:
+                continue
+
+            column = self.columns[k]
+
+            if callable(v):
+                mask &= np.fromiter(
+                    (bool(v(x)) for x in column), dtype=bool, count=len(column)
+                )
+                continue
+
+            if not isinstance(v, (list, tuple, set)):
+                v = [v]
+
+            # Cast the requested values to the type of the metadata
+            first = next((x for x in column if x is not None), None)
+            if first is not None:
+                if isinstance(first, np.generic):
+                    first = first.item()
+                cast = type(first)
+                v = [cast(y) for y in v]
+
+            if column.dtype == object:
+                v = set(v)
+                mask &= np.fromiter(
+                    (x in v for x in column), dtype=bool, count=len(column)
+                )
+            else:
+                mask &= np.isin(column, list(v))
+
+        return np.flatnonzero(mask)
+
+    def order(self, kwargs):
+        """Returns the positions of the elements sorted according to `kwargs`,
+        with the same semantics as :py:class:`climetlab.core.index.Order`,
+        or None if the order cannot be vectorised."""
+        if any(callable(v) for v in kwargs.values()):
+            return None
+
+        self.load(*kwargs.keys())
+
+        keys = []
+        for k, v in kwargs.items():
+            column = self.columns[k]
+
+            if v == "ascending" or v is None:
+                keys.append(_ranks(column))
+                continue
+
+            if v == "descending":
+                keys.append(-_ranks(column))
+                continue
+
+            order = {}
+            for i, key in enumerate(v):
+                order[str(key)] = i
+                try:
+                    order[int(key)] = i
+                except ValueError:
+                    pass
+                try:
+                    order[float(key)] = i
+                except ValueError:
+                    pass
+
+            if column.dtype == object:
+                keys.append(
+                    np.fromiter(
+                        (order[x] for x in column), dtype=np.int64, count=len(column)
+                    )
+                )
+                continue
+
+            # Map each distinct value only once
+            unique, inverse = np.unique(column, return_inverse=True)
+            ranks = np.array([order[x] for x in unique.tolist()], dtype=np.int64)
+            keys.append(ranks[inverse.reshape(-1)])
+
+        if not keys:
+            return np.arange(len(self))
+
+        # np.lexsort is stable and uses the last key as the primary one
+        return np.lexsort(keys[::-1])
+
+    def unique_values(self, *keys):
+        """Returns the unique values of each key, in order of first appearance."""
+        self.load(*keys)
+
+        result = {}
+        for k in keys:
+            column = self.columns[k]
+            if column.dtype == object:
+                result[k] = tuple(dict.fromkeys(column).keys())
+            else:
+                _, first = np.unique(column, return_index=True)
+                result[k] = tuple(column[np.sort(first)].tolist())
+        return result
@@ -1,8 +1,12 @@
 import logging
 import threading
+from collections import deque
 
 LOG = logging.getLogger(__name__)
 
+# Marks the threads running the calls of ordered_map()
+_LOCAL = threading.local()
+
 
 class Future:
     def __init__(self, func, args, kwargs):
@@ -100,3 +104,32 @@ class SoftThreadPool:
         with self._lock:
             if self._error:
                 raise self._error
+
+
+def ordered_map(func, iterable, nthreads, lookahead=None):
+    """Like `map`, but `func` is called in up to `nthreads` threads.
+    Results are yielded in the order of `iterable`, with at most
+    `lookahead` calls (default: twice `nthreads`) pending at a time.
+    """
+    if nthreads < 2 or getattr(_LOCAL, "in_ordered_map", False):
+        # Nested calls run in the thread of their caller, so that
+        # there is only one level of parallelism
+        yield from map(func, iterable)
+        return
+
+    if lookahead is None:
+        lookahead = 2 * nthreads
+
+    def call(x):
+        _LOCAL.in_ordered_map = True
+        return func(x)
+
+    with SoftThreadPool(nthreads=nthreads) as pool:
+        pending = deque()
+        for x in iterable:
+            pending.append(pool.submit(call, x))
+            if len(pending) >= lookahead:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
@@ -11,6 +11,8 @@ import logging
 import math
 import re
 
+import numpy as np
+
 LOG = logging.getLogger(__name__)
 
 
@@ -37,6 +39,8 @@ def index_to_coords(index, shape):
 
 
 class FieldCube:
+    AUTO_CHUNK_SIZE = "16M"
+
     def __init__(
         self,
         ds,
@@ -194,7 +198,18 @@ class FieldCube:
             for n, i in zip(itertools.product(*names), itertools.product(*indexes))
         )
 
-    def chunking(self, chunks):
+    def chunking(self, chunks, dtype="float32"):
+        """Returns the chunks of the target array, from the `chunks` of the config.
+
+        `chunks` is either a dictionary with the number of elements per chunk along
+        some of the coordinates, or a target size of the chunks such as "16M", or
+        "auto" for AUTO_CHUNK_SIZE. With a size, the chunks span the other dimensions
+        in full, so that reading one step reads a single row of chunks, and the
+        number of steps per chunk is chosen to get close to the size.
+        """
+        if chunks == "auto":
+            chunks = self.AUTO_CHUNK_SIZE
+
         if isinstance(chunks, (str, int)):
             m = re.match(r"(\d+)\s*(.*)?", str(chunks))
             if not m:
@@ -205,12 +220,23 @@ class FieldCube:
                 unit = "m"
             size *= dict(k=1024, m=1024 * 1024, g=1024 * 1024 * 1024)[unit[0]]
 
-            # TODO: use dtype.
-            # We assuming float32 = 4 bytes per
-
-            rest = math.prod(self.extended_user_shape[1:]) * 4
-            first = int(size / rest + 0.5)
-            return (first,) + self.extended_user_shape[1:]
+            shape = list(self.extended_user_shape)
+            axis = 1 if self.grid_points_first else 0
+            step = math.prod(shape) // shape[axis] * np.dtype(dtype).itemsize
+
+            if step <= size:
+                shape[axis] = min(max(1, int(size / step + 0.5)), shape[axis])
+            else:
+                # One step is larger than the target, split its largest
+                # dimension in equal parts
+                shape[axis] = 1
+                i = max(
+                    (i for i in range(len(shape)) if i != axis),
+                    key=lambda i: shape[i],
+                )
+                shape[i] = math.ceil(shape[i] / math.ceil(step / size))
+
+            return tuple(shape)
 
         if not chunks:
             return True  # Let ZARR choose
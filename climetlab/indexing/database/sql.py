@@ -11,6 +11,7 @@ import datetime
 import hashlib
 import json
 import logging
+import math
 import os
 import sqlite3
 from threading import local
@@ -42,10 +43,6 @@ def dump_sql(statement):
     statement = statement.replace(";", " ;")
     statement = statement.replace("(", " (")
     lst = statement.split()
-    lst = [
-        "userorder_entries_...\n" if x.startswith("userorder_entries") else x
-        for x in lst
-    ]
     print(" ".join(lst))
 
 
@@ -56,6 +53,24 @@ def execute(connection, statement, *arg, **kwargs):
     return connection.execute(statement, *arg, **kwargs)
 
 
+def _sql_literal(x):
+    if isinstance(x, int) and not isinstance(x, bool):
+        return str(x)
+    if isinstance(x, float) and math.isfinite(x):
+        return repr(x)
+    x = str(x).replace("'", "''")
+    return f"'{x}'"
+
+
+def _sql_identifier(name):
+    name = name.replace('"', '""')
+    return f'"{name}"'
+
+
+def _columns(connection, view):
+    return [x[1] for x in execute(connection, f"PRAGMA table_info({view});")]
+
+
 def entryname_to_dbname(n):
     n = dict(
         levellist="levelist",
@@ -100,6 +115,14 @@ def dbname_to_entryname(n):
 
 class EntriesLoader:
     table_name = "entries"
+    # Keys that are usually selected together, see build_sql_indexes()
+    QUERY_PATTERNS = [("param", "levelist", "date", "time")]
+    BATCH_SIZE = 10_000
+    PRAGMAS = dict(
+        journal_mode="MEMORY",
+        synchronous="OFF",
+        cache_size=-64_000,  # In KiB
+    )
 
     def __init__(self, connection):
         self.connection = connection
@@ -184,55 +207,116 @@ class EntriesLoader:
         name = entryname_to_dbname(k)
         return klass(name)
 
+    def set_pragmas(self, **pragmas):
+        """Set the given pragmas and return their previous values."""
+        previous = {}
+        for k, v in pragmas.items():
+            for res in execute(self.connection, f"PRAGMA {k};"):
+                previous[k] = res[0]
+            execute(self.connection, f"PRAGMA {k} = {v};")
+        return previous
+
     def load_iterator(self, iterator):
         paths_or_urls = set()
 
-        count = 0
-        for entry in iterator:
-            if count == 0:
-                self.keys = self.create_table_from_entry_if_needed(entry)
+        # Trade durability for speed while loading, the index can be rebuilt
+        previous = self.set_pragmas(**self.PRAGMAS)
+        try:
+            # All the inserts are in a single transaction, rolled back on error
+            with self.connection:
+                count = 0
+                batch = []
+                for entry in iterator:
+                    if count == 0:
+                        self.keys = self.create_table_from_entry_if_needed(entry)
+
+                    if "_path" in entry:
+                        paths_or_urls.add(entry["_path"])
+                    if "_url" in entry:
+                        paths_or_urls.add(entry["_url"])
+
+                    batch.append(entry)
+                    count += 1
+
+                    if len(batch) >= self.BATCH_SIZE:
+                        self._insert_batch(batch)
+                        batch = []
+
+                if batch:
+                    self._insert_batch(batch)
+
+                date = datetime.datetime.now().isoformat()
+                for path in paths_or_urls:
+                    self.path_table.insert(path, date)
+        finally:
+            # Some pragmas (e.g. journal_mode) cannot be changed in a transaction
+            self.set_pragmas(**previous)
+
+        return count
 
+    def _insert_batch(self, batch):
+        # Discover the columns of the whole batch before inserting
+        new_columns = {}
+        for entry in batch:
             for k, v in entry.items():
+                if k in new_columns:
+                    continue
                 dbname = entryname_to_dbname(k)
                 if dbname not in self.keys:
-                    LOG.debug(f"Inserting column in databse {k}, {dbname}")
-                    self.keys = self._add_column(k, v)
-
-            if "_path" in entry:
-                paths_or_urls.add(entry["_path"])
-            if "_url" in entry:
-                paths_or_urls.add(entry["_url"])
-
-            column_names = [k for k, v in self.keys.items()]
-            statement = (
-                f"INSERT INTO {self.table_name} ("
-                + ",".join(column_names)
-                + ") VALUES("
-                + ",".join(["?"] * len(column_names))
-                + ");"
-            )
-            values = [entry.get(dbname_to_entryname(k)) for k, v in self.keys.items()]
-            execute(self.connection, statement, tuple(values))
-            count += 1
+                    new_columns[k] = v
 
-        date = datetime.datetime.now().isoformat()
-        for path in paths_or_urls:
-            self.path_table.insert(path, date)
+        for k, v in new_columns.items():
+            LOG.debug(f"Inserting column in database {k}, {entryname_to_dbname(k)}")
+            self.keys = self._add_column(k, v)
 
-        return count
+        column_names = list(self.keys.keys())
+        entry_names = [dbname_to_entryname(k) for k in column_names]
+        statement = (
+            f"INSERT INTO {self.table_name} ("
+            + ",".join(column_names)
+            + ") VALUES("
+            + ",".join(["?"] * len(column_names))
+            + ");"
+        )
+        self.connection.executemany(
+            statement,
+            (tuple(entry.get(k) for k in entry_names) for entry in batch),
+        )
 
-    def build_sql_indexes(self):
-        indexed_columns = [k for k, v in self.keys.items() if k.startswith("i_")]
-        indexed_columns += ["path"]
+    def build_sql_indexes(self, query_patterns=None):
+        if query_patterns is None:
+            query_patterns = self.QUERY_PATTERNS
+
+        indexes = {}
+        for k in self.keys:
+            if k.startswith("i_"):
+                indexes[f"{k}_index"] = [k]
+
+        # Covering index for lookup_parts(): the parts can be read from the index only
+        indexes["path_offset_length_index"] = ["path", "offset", "length"]
+
+        # Composite indexes for keys that are usually selected together,
+        # also covering lookup_parts() for these selections
+        for pattern in query_patterns:
+            columns = [entryname_to_dbname(k) for k in pattern]
+            missing = [c for c in columns if c not in self.keys]
+            if missing:
+                LOG.debug(f"Not creating index for {pattern}, missing {missing}")
+                continue
+            columns += ["path", "offset", "length"]
+            indexes["_".join(columns[:-3]) + "_composite_index"] = columns
 
-        pbar = tqdm(indexed_columns, desc="Building indexes")
-        for n in pbar:
-            pbar.set_description(f"Building index for {n}")
+        pbar = tqdm(indexes.items(), desc="Building indexes")
+        for name, columns in pbar:
+            pbar.set_description(f"Building index for {','.join(columns)}")
             execute(
                 self.connection,
-                f"CREATE INDEX IF NOT EXISTS {n}_index ON {self.table_name} ({n});",
+                f"CREATE INDEX IF NOT EXISTS {name} ON {self.table_name} ({','.join(columns)});",
             )
 
+        # Let the query planner know about the selectivity of each index
+        execute(self.connection, "ANALYZE;")
+
     def __str__(self):
         content = ",".join([k for k, v in self.keys.items()])
         return f"{self.__class__.__name__}({self.table_name},{content}"
@@ -242,8 +326,12 @@ class Connection(local):
     # Inheriting from threading.local allows one connection for each thread
     # __init__ is "called each time the local object is used in a separate thread".
     # https://github.com/python/cpython/blob/0346eddbe933b5f1f56151bdebf5bd49392bc275/Lib/_threading_local.py#L65
+    MAX_PAGED_QUERIES = 8
+
     def __init__(self, db_path):
         self._conn = sqlite3.connect(db_path)
+        # Position of the last page read of each query, see SqlDatabase._fetch_page()
+        self.pages = {}
 
 
 class SqlFilter:
@@ -339,16 +427,23 @@ class SqlRemapping(SqlFilter):
             joiner = SqlCustomJoiner()
             alias = entryname_to_dbname(k)
             expr = self.remapping.substitute(k, joiner)
-            sql_concatenations.append(f"TRIM({expr},'_') AS {alias}")
-
-        select = ", ".join(sql_concatenations)
+            sql_concatenations.append(f"TRIM({expr},'_') AS {_sql_identifier(alias)}")
 
         if not sql_concatenations:
             return None
 
+        # The remapped columns replace the existing ones with the same name
+        aliases = [entryname_to_dbname(k) for k in self.remapping.remapping]
+        columns = [
+            _sql_identifier(c)
+            for c in _columns(db.connection, old_view)
+            if c not in aliases
+        ]
+        select = ", ".join(columns + sql_concatenations)
+
         assert new_view != old_view
         return (
-            f"CREATE TEMP VIEW IF NOT EXISTS {new_view} AS SELECT *, {select} "
+            f"CREATE TEMP VIEW IF NOT EXISTS {new_view} AS SELECT {select} "
             f"FROM {old_view};"
         )
 
@@ -366,10 +461,7 @@ class SqlOrder(SqlFilter):
         return SqlOrder(kwargs)
 
     def create_view_statement(self, db, old_view, new_view):
-        func_name = "userorder_" + new_view
-
         order_bys = []
-        dict_of_dicts = {}
 
         for k, v in self.kwargs.items():
             name = entryname_to_dbname(k)
@@ -383,9 +475,11 @@ class SqlOrder(SqlFilter):
                 order_bys.append(name + " DESC")
                 continue
             if isinstance(v, (list, tuple)):
+                # Sort on the position of the value in the list, values
+                # not in the list come last
                 v = [dbkey.cast(x) for x in v]
-                dict_of_dicts[name] = dict(zip(v, range(len(v))))
-                order_bys.append(func_name + "(" + "'" + name + "'" + ", " + name + ")")
+                cases = [f"WHEN {_sql_literal(x)} THEN {i}" for i, x in enumerate(v)]
+                order_bys.append(f"CASE {name} {' '.join(cases)} ELSE {len(v)} END")
                 continue
 
             raise ValueError(f"{k},{v}, {type(v)}")
@@ -393,14 +487,8 @@ class SqlOrder(SqlFilter):
         if not order_bys:
             return None
 
-        if dict_of_dicts:
-
-            def order_func(k, v):
-                return dict_of_dicts[k][v]
-
-            if LOG.level == logging.DEBUG:
-                sqlite3.enable_callback_tracebacks(True)
-            db.connection.create_function(func_name, 2, order_func, deterministic=True)
+        # Keep the order of the entries for equal keys
+        order_bys.append("_rowid")
 
         assert new_view != old_view
         return (
@@ -411,6 +499,72 @@ class SqlOrder(SqlFilter):
         )
 
 
+class SqlMaterialisation(SqlFilter):
+    """Stores the rowids of the entries selected by the previous filters in a
+    temporary table, so that the chain of views is evaluated only once. The
+    order of the entries is kept: the `_rowid` of the new view is the position
+    of the entry in the table."""
+
+    def table_name(self, view):
+        return view + "_rows"
+
+    def create_new_view(self, db, view):
+        new_view = "entries_" + self.h(parent_view=view)
+        table = self.table_name(new_view)
+        connection = db.connection
+
+        exists = execute(
+            connection,
+            "SELECT name FROM sqlite_temp_master WHERE type='table' AND name=?;",
+            (table,),
+        ).fetchall()
+
+        previous = db._filters[: db._filters.index(self)]
+
+        # Columns computed by the views, e.g. by a SqlRemapping, which
+        # may replace columns of the entries
+        entries = _columns(connection, EntriesLoader.table_name)
+        remapped = set()
+        for f in previous:
+            if isinstance(f, SqlRemapping):
+                remapped.update(entryname_to_dbname(k) for k in f.remapping.remapping)
+        extra = [
+            c
+            for c in _columns(connection, view)
+            if c != "_rowid" and (c not in entries or c in remapped)
+        ]
+
+        if not exists:
+            order_str = "" if db._is_ordered(previous) else " ORDER BY _rowid"
+            statements = [
+                f"CREATE TEMP TABLE {table} AS SELECT "
+                + ", ".join(["_rowid AS entry"] + [_sql_identifier(c) for c in extra])
+                + f" FROM {view}{order_str};",
+                f"CREATE INDEX temp.{table}_entry_index ON {table} (entry);",
+            ]
+            with connection:
+                for statement in statements:
+                    LOG.debug("%s", statement)
+                    execute(connection, statement)
+
+            LOG.debug("Materialised %s into %s", view, table)
+
+        # The rows of the table are in the order of the view
+        select = ", ".join(
+            ["m.rowid AS _rowid"]
+            + [f"e.{_sql_identifier(c)}" for c in entries if c not in extra]
+            + [f"m.{_sql_identifier(c)}" for c in extra]
+        )
+        statement = (
+            f"CREATE TEMP VIEW IF NOT EXISTS {new_view} AS SELECT {select} "
+            f"FROM {table} AS m JOIN {EntriesLoader.table_name} AS e ON e.rowid = m.entry;"
+        )
+        LOG.debug("%s", statement)
+        execute(connection, statement)
+
+        return new_view
+
+
 class VersionedDatabaseMixin:
     VERSION = 6
 
@@ -449,22 +603,59 @@ class PathTable:
         self.ensure_table()
 
     def ensure_table(self):
-        statement = f"CREATE TABLE IF NOT EXISTS {self.table_name} (key TEXT PRIMARY KEY, date TEXT);"
+        statement = (
+            f"CREATE TABLE IF NOT EXISTS {self.table_name}"
+            " (key TEXT PRIMARY KEY, date TEXT, size INTEGER, mtime FLOAT);"
+        )
         for i in execute(self.connection, statement):
             LOG.error(str(i))  # Output of .execute should be empty
 
+        # Tables created by older versions do not record the files stats
+        for name, typ in (("size", "INTEGER"), ("mtime", "FLOAT")):
+            try:
+                execute(
+                    self.connection,
+                    f"ALTER TABLE {self.table_name} ADD COLUMN {name} {typ};",
+                )
+            except sqlite3.OperationalError:
+                pass
+
     def insert(self, key, date):
         statement = f"""INSERT INTO {self.table_name} (key, date) VALUES(?,?);"""
         LOG.debug("%s", statement)
         execute(self.connection, statement, (key, date))
 
     def get_date(self, key):
-        statement = f"""SELECT * FROM {self.table_name} WHERE key="{key}";"""
+        statement = f"""SELECT date FROM {self.table_name} WHERE key=?;"""
         LOG.debug("%s", statement)
-        for key, date in execute(self.connection, statement):
+        for (date,) in execute(self.connection, statement, (key,)):
             return date
         return None
 
+    def set_stats(self, stats, date):
+        statement = (
+            f"INSERT OR REPLACE INTO {self.table_name} (key, date, size, mtime)"
+            " VALUES(?,?,?,?);"
+        )
+        LOG.debug("%s", statement)
+        self.connection.executemany(
+            statement,
+            ((key, date, size, mtime) for key, (size, mtime) in stats.items()),
+        )
+
+    def get_stats(self):
+        statement = f"""SELECT key, size, mtime FROM {self.table_name};"""
+        LOG.debug("%s", statement)
+        return {
+            key: (size, mtime)
+            for key, size, mtime in execute(self.connection, statement)
+        }
+
+    def delete(self, keys):
+        statement = f"""DELETE FROM {self.table_name} WHERE key=?;"""
+        LOG.debug("%s", statement)
+        self.connection.executemany(statement, ((key,) for key in keys))
+
 
 class SqlDatabase(Database, VersionedDatabaseMixin):
     EXTENSION = ".db"
@@ -486,13 +677,31 @@ class SqlDatabase(Database, VersionedDatabaseMixin):
     def __str__(self):
         return f"{self.__class__.__name__}({self.db_path},filters=[{','.join([str(_) for _ in self._filters])}])"
 
-    def build_indexes(self):
-        EntriesLoader(self.connection).build_sql_indexes()
+    def build_indexes(self, query_patterns=None):
+        """Builds the sql indexes. `query_patterns` is a list of tuples of keys that
+        are selected together, such as ("param", "levelist", "date", "time").
+        A composite index is created for each of them."""
+        with self.connection as connection:
+            EntriesLoader(connection).build_sql_indexes(query_patterns)
+
+    def _base_view(self):
+        # The order of the rows must not depend on the index used by sqlite for
+        # a query, e.g. lookup_parts() can scan a covering index while lookup_dicts()
+        # scans the table, so the views expose the rowid of the entries.
+        if not self.dbkeys:
+            return EntriesLoader.table_name
+        view = "entries_with_rowid"
+        execute(
+            self.connection,
+            f"CREATE TEMP VIEW IF NOT EXISTS {view} AS "
+            f"SELECT rowid AS _rowid, * FROM {EntriesLoader.table_name};",
+        )
+        return view
 
     @property
     def view(self):
         if self._view is None:
-            self._view = "entries"
+            self._view = self._base_view()
             for f in self._filters:
                 self._view = f.create_new_view(self, self._view)
             LOG.debug("DB %s %s", self.db_path, self._view)
@@ -518,14 +727,26 @@ class SqlDatabase(Database, VersionedDatabaseMixin):
             #     order = orders[0].merge(*orders)
             #     view = order.create_new_view(self, view)
 
+            columns = [entryname_to_dbname(c) for c in coords]
+            if not columns:
+                return {}
+
+            # All the columns in one scan, the values are in order of first
+            # appearance in the view. They are collected in Python, as the
+            # JSON aggregates of sqlite do not keep the precision of floats
+            order_str = "" if self._is_ordered() else " ORDER BY _rowid"
+            statement = f"SELECT {','.join(columns)} FROM {view}{order_str};"
+            LOG.debug("%s", statement)
+
+            values = {c: {} for c in columns}
+            for row in execute(con, statement):
+                for column, value in zip(columns, row):
+                    values[column][value] = None
+
             results = {}
-            for c in coords:
-                column = entryname_to_dbname(c)
-                values = [
-                    v[0] for v in execute(con, f"SELECT DISTINCT {column} FROM {view};")
-                ]
-                LOG.debug("Reordered values for {column}", column, values)
-                results[column] = values
+            for column in columns:
+                results[column] = list(values[column])
+                LOG.debug("Unique values for %s: %s", column, results[column])
 
         return results
 
@@ -540,6 +761,27 @@ class SqlDatabase(Database, VersionedDatabaseMixin):
             date = PathTable(connection).get_date(path_or_url)
             return date is not None
 
+    def paths_stats(self):
+        """Returns the (size, mtime) recorded for each path of the database."""
+        with self.connection as connection:
+            return PathTable(connection).get_stats()
+
+    def set_paths_stats(self, stats):
+        """Records the (size, mtime) of the given paths."""
+        date = datetime.datetime.now().isoformat()
+        with self.connection as connection:
+            PathTable(connection).set_stats(stats, date)
+
+    def remove_paths(self, paths):
+        """Removes the paths and all their entries from the database."""
+        with self.connection as connection:
+            if EntriesLoader(connection).keys:
+                connection.executemany(
+                    f"DELETE FROM {EntriesLoader.table_name} WHERE path=?;",
+                    ((path,) for path in paths),
+                )
+            PathTable(connection).delete(paths)
+
     def load_iterator(self, iterator):
         with self.connection as connection:
             loader = EntriesLoader(connection)
@@ -588,17 +830,67 @@ class SqlDatabase(Database, VersionedDatabaseMixin):
 
     def _execute_select(self, column_names, limit=None, offset=None):
         names_str = ",".join([x for x in column_names]) if column_names else "*"
-        limit_str = f" LIMIT {limit}" if limit is not None else ""
-        offset_str = f" OFFSET {offset}" if offset is not None else ""
 
-        statement = f"SELECT {names_str} FROM {self.view} {limit_str} {offset_str};"
-        LOG.debug("%s", statement)
+        if self._is_ordered():
+            statement = f"SELECT {names_str} FROM {self.view}"
+        else:
+            if limit is not None:
+                # The rowid of the last row of each page is needed to page
+                names_str = f"_rowid,{names_str}"
+            statement = f"SELECT {names_str} FROM {self.view} ORDER BY _rowid"
+
+        if limit is None:
+            offset_str = f" LIMIT -1 OFFSET {offset}" if offset is not None else ""
+            statement = f"{statement}{offset_str};"
+            LOG.debug("%s", statement)
+            yield from execute(self.connection, statement)
+            return
 
-        for tupl in execute(self.connection, statement):
-            yield tupl
+        yield from self._fetch_page(statement, limit, offset or 0)
+
+    def _fetch_page(self, statement, limit, offset):
+        # Paging with LIMIT/OFFSET makes sqlite skip all the previous rows for each
+        # page. When the pages are read in sequence, the next page of a view ordered
+        # by _rowid starts after the last rowid of the previous one instead.
+        # No cursor is left open between pages, as it would keep the database locked.
+        connection = self.connection
+        pages = self._connection.pages
+        keyset = not self._is_ordered()
+
+        position, last = pages.pop(statement, (None, None))
+        if keyset and position == offset:
+            where = f"WHERE _rowid > {last} ORDER BY _rowid"
+            paged = statement.replace("ORDER BY _rowid", where) + f" LIMIT {limit};"
+        else:
+            paged = f"{statement} LIMIT {limit} OFFSET {offset};"
+
+        LOG.debug("%s", paged)
+        rows = execute(connection, paged).fetchall()
+
+        if keyset:
+            if len(rows) == limit:
+                pages[statement] = (offset + limit, rows[-1][0])
+                while len(pages) > Connection.MAX_PAGED_QUERIES:
+                    pages.pop(next(iter(pages)))
+            rows = [row[1:] for row in rows]
+
+        return rows
+
+    def _is_ordered(self, filters=None):
+        # SqlOrder views are already ordered, the others are ordered by _rowid
+        for f in reversed(self._filters if filters is None else filters):
+            if isinstance(f, SqlOrder):
+                return True
+            if isinstance(f, SqlMaterialisation):
+                return False
+        return False
 
     def count(self):
-        statement = f"SELECT COUNT(*) FROM {self.view};"
+        view = self.view
+        if self._filters and isinstance(self._filters[-1], SqlMaterialisation):
+            # No need to join with the entries
+            view = self._filters[-1].table_name(view)
+        statement = f"SELECT COUNT(*) FROM {view};"
         for result in execute(self.connection, statement):
             return result[0]
         assert False, statement  # Fail if result is empty.
@@ -21,8 +21,11 @@ import numpy as np
 
 import climetlab as cml
 from climetlab.core.order import build_remapping, normalize_order_by
+from climetlab.core.settings import SETTINGS
+from climetlab.core.thread import ordered_map
 from climetlab.utils import load_json_or_yaml, progress_bar
 from climetlab.utils.humanize import bytes, seconds
+from climetlab.utils.stats import Statistics
 
 LOG = logging.getLogger(__name__)
 
@@ -41,6 +44,8 @@ class Config:
         self.loop = self.config.get("loop")
         self.chunking = self.output.get("chunking", {})
         self.dtype = self.output.get("dtype", "float32")
+        self.compression = self.output.get("compression")
+        self.dataset = self.output.get("dataset", "dataset")
 
         self.flatten_values = self.output.get("flatten_values", False)
         self.grid_points_first = self.output.get("grid_points_first", False)
@@ -63,6 +68,7 @@ class Config:
 
             assert statistics_axis >= 0, (statistics_axis_name, self.order)
 
+            self.statistics_coord = statistics_axis_name
             self.statistics_names = self.order[statistics_axis_name]
 
             # TODO: consider 2D grid points
@@ -120,98 +126,437 @@ def _tidy(o):
     return str(o)
 
 
-class FastWriter:
-    def __init__(self, array, shape):
-        self.array = array
-        self.cache = np.zeros(shape)
-        self.shape = shape
+class ChunkWriter:
+    """Writes the cubelets to `array` through a buffer holding one row of chunks
+    along `axis`, i.e. `chunk` consecutive indices along that axis and the full
+    extent of the other dimensions. The buffer is written to the target when a
+    cubelet falls outside of it, so the cubelets must come in order along `axis`.
 
-    def __setitem__(self, key, value):
-        self.cache[key] = value
+    With `offset`, the data is written from that index along `axis` (when appending).
+    If `statistics_axis` is not None, the statistics of the data are collected
+    per index along that axis."""
 
-    def flush(self):
-        self.array[:] = self.cache[:]
-
-    def stats(self, axis):
-        sel = [slice(None)] * len(self.shape)
-        sums = np.zeros(self.shape[axis])
-        squares = np.zeros(self.shape[axis])
-        minima = np.zeros(self.shape[axis])
-        maxima = np.zeros(self.shape[axis])
-        count = None
-        for k in range(self.shape[axis]):
-            sel[axis] = k
-            values = self.cache[tuple(sel)]
-            sums[k] = np.sum(values)
-            squares[k] = np.sum(values * values)
-            minima[k] = np.amin(values)
-            maxima[k] = np.amax(values)
-            if count is None:
-                count = values.size
-            else:
-                assert count == values.size
-
-        return (count, sums, squares, minima, maxima)
-
-
-class OffsetView:
-    def __init__(self, array, offset, axis, shape):
+    def __init__(self, array, shape, axis, chunk, offset=0, statistics_axis=None):
         self.array = array
-        self.offset = offset
-        self.axis = axis
         self.shape = shape
+        self.axis = axis
+        self.chunk = max(1, chunk)
+        self.offset = offset
+
+        self.statistics_axis = statistics_axis
+        self.statistics = None
+        if statistics_axis is not None:
+            self.statistics = Statistics(
+                axis=statistics_axis,
+                size=shape[statistics_axis],
+            )
+
+        self.buffer = None
+        self.start = None  # Range of the buffer along `axis`, in target coordinates
+        self.stop = None
+
+    def _target_key(self, key, start, stop=None):
+        key = list(key)
+        key[self.axis] = start if stop is None else slice(start, stop)
+        return tuple(key)
 
     def __setitem__(self, key, value):
-        if isinstance(key, slice):
-            assert key.start is None and key.stop is None, key
-            new_key = tuple(
-                slice(self.offset, self.offset + value.shape[i])
-                if i == self.axis
-                else slice(None)
-                for i in range(len(self.shape))
+        i = key[self.axis]
+        assert isinstance(i, int), key
+        i += self.offset
+
+        if self.buffer is None or not (self.start <= i < self.stop):
+            if self.start is not None and i < self.start:
+                raise ValueError(
+                    f"Cubelet {key} written after its chunk row [{self.start}:{self.stop}]"
+                )
+
+            self.flush()
+
+            # Align the rows with the chunks of the target
+            self.start = max((i // self.chunk) * self.chunk, self.offset)
+            self.stop = min(
+                (i // self.chunk + 1) * self.chunk, self.offset + self.shape[self.axis]
             )
+
+            shape = list(self.shape)
+            shape[self.axis] = self.stop - self.start
+            self.buffer = np.zeros(shape)
+
+        self.buffer[self._target_key(key, i - self.start)] = value
+
+    def flush(self):
+        if self.buffer is None:
+            return
+
+        key = self._target_key((slice(None),) * len(self.shape), self.start, self.stop)
+        self.array[key] = self.buffer
+
+        if self.statistics_axis == self.axis:
+            stats = Statistics(axis=self.axis, size=self.stop - self.start)
+            self.statistics.merge(stats.add(self.buffer), self.start - self.offset)
+        elif self.statistics is not None:
+            self.statistics.add(self.buffer)
+
+        self.buffer = None
+
+
+def parse_part(part):
+    """Parses a partition given as "i/N" on the command line into (i, N)."""
+    m = re.match(r"^\s*(\d+)\s*/\s*(\d+)\s*$", str(part))
+    if not m:
+        raise ValueError(f"Invalid partition '{part}', must be of the form i/N")
+    part, parts = int(m.group(1)), int(m.group(2))
+    if not 1 <= part <= parts:
+        raise ValueError(f"Invalid partition {part}/{parts}")
+    return part, parts
+
+
+def partition_range(length, chunk, part, parts):
+    """Range along the append axis of the `part`-th (from 1) of `parts` partitions.
+    The partitions are made of whole chunks, so concurrent writers never write to
+    the same chunk."""
+    nchunks = -(-length // chunk)
+    start = ((part - 1) * nchunks) // parts * chunk
+    stop = min((part * nchunks) // parts * chunk, length)
+    return start, stop
+
+
+class Ledger:
+    """Records the partitions of a target that are fully loaded, with their
+    statistics, so that an interrupted creation can be resumed. Each partition
+    has its own file, so concurrent processes do not update the same file."""
+
+    def __init__(self, path, parts):
+        self.path = path
+        self.parts = parts
+
+    def _file(self, part):
+        return os.path.join(self.path, f"part-{part}-of-{self.parts}.npz")
+
+    def done(self, part):
+        return os.path.exists(self._file(part))
+
+    def remaining(self):
+        return [i for i in range(1, self.parts + 1) if not self.done(i)]
+
+    def record(self, part, statistics=None):
+        os.makedirs(self.path, exist_ok=True)
+        path = self._file(part)
+        tmp = f"{path}.{os.getpid()}.tmp.npz"
+        if statistics is None:
+            np.savez(tmp)
         else:
-            new_key = tuple(
-                k + self.offset if i == self.axis else k for i, k in enumerate(key)
-            )
-        self.array[new_key] = value
+            statistics.save(tmp)
+        os.replace(tmp, path)
+
+    def statistics(self, axis):
+        return [
+            Statistics.load(self._file(i), axis=axis) for i in range(1, self.parts + 1)
+        ]
 
 
 class Loader:
-    pass
+    writer = None
+    coords = None
+    statistics = None
+
+    # Whether several processes can write partitions of the target at once
+    concurrent_writes = False
+
+    def statistics_from_ledger(self, parts):
+        # Statistics of all the partitions, including those
+        # loaded by other processes
+        self.statistics = None
+        for stats in self.ledger(parts).statistics(self.config.statistics_axis):
+            self.add_statistics(stats)
+
+    def check_coords(self, cube, append, previous):
+        """Sets the coordinates of the target from those of `cube`. When appending,
+        the coordinates of the existing target, from its `previous` metadata, are
+        extended along the first one, and all the others must be the same.
+        Returns the number of steps already loaded, or None if unknown."""
+        coords = {k: _tidy(list(v)) for k, v in cube.user_coords.items()}
+        loaded = None
+
+        if append:
+            if self.coords is None:
+                self.coords = previous.get("coords")
+
+            if self.coords is None:
+                warnings.warn(
+                    f"'{self.path}' has no coordinates in its metadata,"
+                    " the appended data cannot be checked"
+                )
+                return None
+
+            if list(self.coords) != list(coords):
+                raise ValueError(
+                    f"Cannot append to '{self.path}', coordinates"
+                    f" {list(coords)} differ from {list(self.coords)}"
+                )
+
+            first, *others = coords
+            for name in others:
+                if self.coords[name] != coords[name]:
+                    raise ValueError(
+                        f"Cannot append to '{self.path}', values of '{name}'"
+                        f" {coords[name]} differ from {self.coords[name]}"
+                    )
+
+            existing = set(json.dumps(x) for x in self.coords[first])
+            duplicates = [x for x in coords[first] if json.dumps(x) in existing]
+            if duplicates:
+                raise ValueError(
+                    f"Cannot append to '{self.path}', values of '{first}'"
+                    f" {duplicates} are already loaded"
+                )
+
+            loaded = len(self.coords[first])
+            coords[first] = self.coords[first] + coords[first]
+
+        self.coords = coords
+        return loaded
+
+    def discard_unrecorded_steps(self, array, loaded):
+        """Shrinks `array` to the `loaded` steps recorded in its metadata. An
+        append that was interrupted leaves steps that were not recorded, which
+        would otherwise remain before the data appended on the next attempt."""
+        axis = self.config.append_axis
+        shape = list(array.shape)
+
+        if loaded is None or loaded == shape[axis]:
+            return
+
+        if loaded > shape[axis]:
+            raise ValueError(
+                f"'{self.path}' has {shape[axis]} steps along axis {axis},"
+                f" but its metadata records {loaded}"
+            )
+
+        warnings.warn(
+            f"Discarding {shape[axis] - loaded} steps of '{self.path}'"
+            " left by an interrupted append"
+        )
+        shape[axis] = loaded
+        array.resize(tuple(shape))
+
+    def restore_statistics(self, previous):
+        # Statistics of the data loaded in a previous run, when appending
+        state = previous.get("statistics_state")
+        if self.statistics is None and state is not None:
+            self.statistics = Statistics.from_state(
+                state, axis=self.config.statistics_axis
+            )
+
+    def add_statistics(self, stats, offset=0):
+        """Merges `stats`, the statistics of the data written from `offset`
+        along the append axis."""
+        if self.statistics is None:
+            self.statistics = Statistics(
+                axis=stats.axis,
+                size=None if stats.axis is None else offset + len(stats.count),
+            )
+
+        if stats.axis is not None and stats.axis == self.config.append_axis:
+            # One value per step, so the statistics grow when appending
+            size = max(len(self.statistics.count), offset + len(stats.count))
+            self.statistics = (
+                Statistics(axis=stats.axis, size=size)
+                .merge(self.statistics, start=0)
+                .merge(stats, start=offset)
+            )
+        else:
+            self.statistics.merge(stats)
+
+    def chunk_writer(self, array, shape, offset=0):
+        config = self.config
+        axis = config.append_axis
+        self.writer = ChunkWriter(
+            array,
+            shape,
+            axis=axis,
+            chunk=array.chunks[axis],
+            offset=offset,
+            statistics_axis=config.statistics_axis
+            if config.collect_statistics
+            else None,
+        )
+        return self.writer
+
+    def close(self):
+        if self.writer is None:
+            warnings.warn("ChunkWriter already closed")
+        else:
+            self.writer.flush()
+            if self.config.collect_statistics:
+                self.add_statistics(self.writer.statistics, self.writer.offset)
+
+            self.writer = None
+
+    def metadata(self, config, previous):
+        metadata = {}
+
+        if self.coords is None:
+            self.coords = previous.get("coords")
+
+        if self.coords is not None:
+            metadata["coords"] = self.coords
+
+        if config.collect_statistics:
+            self.restore_statistics(previous)
+            stats = self.statistics
+
+            count = stats.count.tolist()
+            mean = stats.mean.tolist()
+            stdev = stats.stdev.tolist()
+            minimum = stats.minimum.tolist()
+            maximum = stats.maximum.tolist()
+            sums = (stats.count * stats.mean).tolist()
+            squares = (stats.m2 + stats.count * stats.mean**2).tolist()
+
+            # The values of the coordinate, unless given in the order
+            names = self.config.statistics_names
+            if not isinstance(names, (list, tuple)):
+                names = self.coords[self.config.statistics_coord]
+
+            name_to_index = metadata["name_to_index"] = {}
+            statistics_by_name = metadata["statistics_by_name"] = {}
+            for i, name in enumerate(names):
+                statistics_by_name[name] = {}
+                statistics_by_name[name]["mean"] = mean[i]
+                statistics_by_name[name]["stdev"] = stdev[i]
+                statistics_by_name[name]["minimum"] = minimum[i]
+                statistics_by_name[name]["maximum"] = maximum[i]
+                statistics_by_name[name]["sums"] = sums[i]
+                statistics_by_name[name]["squares"] = squares[i]
+                statistics_by_name[name]["count"] = count[i]
+                name_to_index[name] = i
+
+            statistics_by_index = metadata["statistics_by_index"] = {}
+            statistics_by_index["mean"] = mean
+            statistics_by_index["stdev"] = stdev
+            statistics_by_index["maximum"] = maximum
+            statistics_by_index["minimum"] = minimum
+            statistics_by_index["count"] = count
+
+            # To update the statistics when appending
+            metadata["statistics_state"] = {
+                k: v.tolist() for k, v in stats.state().items()
+            }
+
+        metadata["config"] = _tidy(config.config)
+
+        return metadata
+
+
+ZARR_SHUFFLE = {
+    True: "shuffle",
+    False: "noshuffle",
+    "byte": "shuffle",
+    "bit": "bitshuffle",
+    "none": "noshuffle",
+}
+
+
+def _zarr_compression(compression):
+    # Returns the options of zarr.open() for `compression`: "none", the name of
+    # the compressor, or a dictionary with its name and options, e.g.
+    # {name: blosc, cname: zstd, level: 5, shuffle: bit} or {name: zstd, level: 3}
+    import zarr
+
+    if compression is None:
+        return {}  # Let ZARR choose
+
+    if isinstance(compression, str):
+        compression = dict(name=compression)
+
+    name = compression["name"]
+    level = compression.get("level")
+    shuffle = ZARR_SHUFFLE[compression.get("shuffle", "byte")]
+
+    if int(zarr.__version__.split(".")[0]) >= 3:
+        from zarr.codecs import BloscCodec, BytesCodec, GzipCodec, ZstdCodec
+
+        codecs = dict(
+            blosc=lambda: BloscCodec(
+                cname=compression.get("cname", "lz4"),
+                clevel=5 if level is None else level,
+                shuffle=shuffle,
+            ),
+            zstd=lambda: ZstdCodec(level=0 if level is None else level),
+            gzip=lambda: GzipCodec(level=5 if level is None else level),
+            none=lambda: None,
+        )
+        if name not in codecs:
+            raise ValueError(f"Invalid ZARR compression '{name}'")
+
+        codec = codecs[name]()
+        return dict(codecs=[BytesCodec()] + ([codec] if codec else []))
+
+    import numcodecs
+
+    compressors = dict(
+        blosc=lambda: numcodecs.Blosc(
+            cname=compression.get("cname", "lz4"),
+            clevel=5 if level is None else level,
+            shuffle=dict(
+                shuffle=numcodecs.Blosc.SHUFFLE,
+                bitshuffle=numcodecs.Blosc.BITSHUFFLE,
+                noshuffle=numcodecs.Blosc.NOSHUFFLE,
+            )[shuffle],
+        ),
+        zstd=lambda: numcodecs.Zstd(level=0 if level is None else level),
+        gzip=lambda: numcodecs.GZip(level=5 if level is None else level),
+        none=lambda: None,
+    )
+    if name not in compressors:
+        raise ValueError(f"Invalid ZARR compression '{name}'")
+
+    return dict(compressor=compressors[name]())
 
 
 class ZarrLoader(Loader):
+    concurrent_writes = True
+
     def __init__(self, path):
         self.path = path
         self.z = None
-        self.statistics = []
 
-    def create_array(self, config, cube, append):
+    def ledger(self, parts):
+        return Ledger(os.path.join(self.path, ".climetlab-progress"), parts)
+
+    def partition_range(self, part, parts):
+        axis = self.config.append_axis
+        return partition_range(self.z.shape[axis], self.z.chunks[axis], part, parts)
+
+    def create_array(self, config, cube, append, partitioned=False):
         import zarr
 
         self.config = config
 
         if not append:
-            self.statistics = []
+            self.statistics = None
+            self.coords = None
 
         shape = cube.extended_user_shape
-        chunks = cube.chunking(config.chunking)
+        chunks = cube.chunking(config.chunking, config.dtype)
         dtype = config.dtype
 
-        print(
-            f"Creating ZARR file '{self.path}', with {shape=}, "
-            f"{chunks=} and {dtype=}"
-        )
+        axis = config.append_axis
+        offset = 0
 
         if append:
             self.z = zarr.open(self.path, mode="r+")
 
+            previous = dict(self.z.attrs.get("climetlab", {}))
+            loaded = self.check_coords(cube, append, previous)
+            self.restore_statistics(previous)
+            self.discard_unrecorded_steps(self.z, loaded)
+
             original_shape = self.z.shape
             assert len(shape) == len(original_shape)
 
-            axis = config.append_axis
-
             new_shape = []
             for i, (o, s) in enumerate(zip(original_shape, shape)):
                 if i == axis:
@@ -220,130 +565,207 @@ class ZarrLoader(Loader):
                     assert o == s, (original_shape, shape, i)
                     new_shape.append(o)
 
+            print(
+                f"Appending to ZARR file '{self.path}'"
+                f" from {original_shape} to {tuple(new_shape)}"
+            )
             self.z.resize(tuple(new_shape))
-
-            self.writer = FastWriter(
-                OffsetView(
-                    self.z,
-                    original_shape[axis],
-                    axis,
-                    shape,
-                ),
-                shape,
+            offset = original_shape[axis]
+
+        elif partitioned:
+            # The array is created by the first partition to start, and
+            # filled by the others
+            print(
+                f"Opening ZARR file '{self.path}', with {shape=}, "
+                f"{chunks=} and {dtype=}"
             )
+            try:
+                self.z = zarr.open(
+                    self.path,
+                    mode="a",
+                    shape=shape,
+                    chunks=chunks,
+                    dtype=dtype,
+                    **_zarr_compression(config.compression),
+                )
+            except ValueError:
+                # Created by another process in the meantime
+                self.z = zarr.open(self.path, mode="r+")
+
+            if self.z.shape != tuple(shape):
+                raise ValueError(
+                    f"Existing ZARR file '{self.path}' has shape {self.z.shape},"
+                    f" expected {tuple(shape)}"
+                )
+
+            self.check_coords(cube, append, {})
+            if "climetlab" not in self.z.attrs:
+                self.z.attrs["climetlab"] = dict(coords=self.coords)
 
         else:
+            print(
+                f"Creating ZARR file '{self.path}', with {shape=}, "
+                f"{chunks=} and {dtype=}"
+            )
             self.z = zarr.open(
                 self.path,
                 mode="w",
                 shape=shape,
                 chunks=chunks,
                 dtype=dtype,
+                **_zarr_compression(config.compression),
             )
 
-            self.writer = FastWriter(self.z, shape)
-
-        return self.writer
+            # The metadata is complete once the data is loaded
+            self.check_coords(cube, append, {})
+            self.z.attrs["climetlab"] = dict(coords=self.coords)
 
-    def close(self):
-        if self.writer is None:
-            warnings.warn("FastWriter already closed")
-        else:
-            self.writer.flush()
-            if self.config.collect_statistics:
-                self.statistics.append(self.writer.stats(self.config.statistics_axis))
-
-            self.writer = None
+        return self.chunk_writer(self.z, shape, offset)
 
     def print_info(self):
         print(self.z.info)
 
-    def add_metadata(self, config):
+    def add_metadata(self, config, parts=None):
         import zarr
 
         assert self.writer is None
 
+        self.config = config
+
+        if parts is not None and config.collect_statistics:
+            self.statistics_from_ledger(parts)
+
         if self.z is None:
             self.z = zarr.open(self.path, mode="r+")
             self.print_info()
 
-        metadata = {}
+        previous = dict(self.z.attrs.get("climetlab", {}))
+        self.z.attrs["climetlab"] = self.metadata(config, previous)
 
-        if config.collect_statistics:
-            count, sums, squares, minimum, maximum = self.statistics[0]
-            for s in self.statistics[1:]:
-                count = count + s[0]
-                sums = sums + s[1]
-                squares = squares + s[2]
-                minimum = np.minimum(minimum, s[3])
-                maximum = np.maximum(maximum, s[4])
 
-            mean = sums / count
-            stdev = np.sqrt(squares / count - mean * mean)
+def _hdf5_compression(compression):
+    # `compression` is the name of the filter, or a dictionary
+    # with its name and options, e.g. {name: gzip, level: 4, shuffle: true}
+    if compression is None:
+        return {}
 
-            name_to_index = metadata["name_to_index"] = {}
-            statistics_by_name = metadata["statistics_by_name"] = {}
-            for i, name in enumerate(self.config.statistics_names):
-                statistics_by_name[name] = {}
-                statistics_by_name[name]["mean"] = mean[i]
-                statistics_by_name[name]["stdev"] = stdev[i]
-                statistics_by_name[name]["minimum"] = minimum[i]
-                statistics_by_name[name]["maximum"] = maximum[i]
-                statistics_by_name[name]["sums"] = sums[i]
-                statistics_by_name[name]["squares"] = sums[i]
-                statistics_by_name[name]["count"] = count
-                name_to_index[name] = i
+    if isinstance(compression, str):
+        compression = dict(name=compression)
 
-            statistics_by_index = metadata["statistics_by_index"] = {}
-            statistics_by_index["mean"] = list(mean)
-            statistics_by_index["stdev"] = list(stdev)
-            statistics_by_index["maximum"] = list(maximum)
-            statistics_by_index["minimum"] = list(minimum)
+    options = dict(compression=compression["name"])
+    if options["compression"] not in ("gzip", "lzf"):
+        raise ValueError(
+            f"Invalid HDF5 compression '{options['compression']}', must be gzip or lzf"
+        )
 
-        metadata["config"] = _tidy(config.config)
+    if "level" in compression:
+        options["compression_opts"] = compression["level"]
 
-        self.z.attrs["climetlab"] = metadata
+    options["shuffle"] = compression.get("shuffle", False)
+    return options
 
 
-class HDF5Loader:
-    def __init__(self, path):
+class HDF5Loader(Loader):
+    def __init__(self, path, dataset=None):
         self.path = path
+        self.dataset = dataset
+        self.h5 = None
+        self.array = None
 
-    def create_array(
-        self, dataset, shape, chunks, dtype, metadata, append, grid_points_first
-    ):
+    def create_array(self, config, cube, append, partitioned=False):
         import h5py
 
+        self.config = config
+
+        if not append:
+            self.statistics = None
+            self.coords = None
+
+        dataset = self.dataset or config.dataset
+        shape = cube.extended_user_shape
+        chunks = cube.chunking(config.chunking, config.dtype)
+        dtype = config.dtype
+
+        if isinstance(chunks, tuple):
+            # Unlike ZARR, HDF5 needs the chunks of all the dimensions
+            chunks = chunks + tuple(shape[len(chunks) :])
+
+        axis = config.append_axis
+        offset = 0
+
         if append:
-            raise NotImplementedError("Appending do HDF5 not yet implemented")
+            self.h5 = h5py.File(self.path, mode="a")
+            array = self.h5[dataset]
 
-        if grid_points_first:
-            raise NotImplementedError("grid_points_first in HDF5 not yet implemented")
+            previous = json.loads(array.attrs.get("climetlab", "{}"))
+            loaded = self.check_coords(cube, append, previous)
+            self.restore_statistics(previous)
+            if array.maxshape[axis] is None:
+                self.discard_unrecorded_steps(array, loaded)
 
-        if not isinstance(chunks, tuple):
-            chunks = None
+            original_shape = array.shape
+            assert len(shape) == len(original_shape)
+            for i, (o, s) in enumerate(zip(original_shape, shape)):
+                if i != axis:
+                    assert o == s, (original_shape, shape, i)
 
-        print(
-            f"Creating HDD5 file '{self.path}', with {dataset=}, {shape=}, {chunks=} and {dtype=}"
-        )
+            if array.maxshape[axis] is not None:
+                raise ValueError(
+                    f"Dataset '{dataset}' of HDF5 file '{self.path}' cannot be"
+                    f" extended along axis {axis}"
+                )
 
-        self.h5 = h5py.File(self.path, mode="w")
-        array = self.h5.create_dataset(
-            dataset,
-            chunks=chunks,
-            maxshape=shape,
-            dtype=dtype,
-            data=np.empty(
-                shape
-            )  # Can we avoid that? Looks like its needed for chuncking
-            # data = h5py.Empty(dtype),
-        )
-        array.attrs["climetlab"] = json.dumps(_tidy(metadata))
-        return array
+            offset = original_shape[axis]
+            print(
+                f"Appending to HDF5 file '{self.path}', dataset '{dataset}'"
+                f" from {original_shape} to {offset + shape[axis]} along axis {axis}"
+            )
+            array.resize(offset + shape[axis], axis=axis)
+
+        elif partitioned and os.path.exists(self.path):
+            # Created when loading a previous partition
+            print(f"Opening HDF5 file '{self.path}', with {dataset=}, {shape=}")
+            self.h5 = h5py.File(self.path, mode="a")
+            array = self.h5[dataset]
+            if array.shape != tuple(shape):
+                raise ValueError(
+                    f"Dataset '{dataset}' of HDF5 file '{self.path}' has shape"
+                    f" {array.shape}, expected {tuple(shape)}"
+                )
+            self.check_coords(cube, append, {})
+
+        else:
+            print(
+                f"Creating HDF5 file '{self.path}', with {dataset=}, {shape=},"
+                f" {chunks=} and {dtype=}"
+            )
+
+            # The dataset is resizable along the append axis, which requires
+            # chunking. The chunks are only allocated when written.
+            maxshape = list(shape)
+            maxshape[axis] = None
+
+            self.h5 = h5py.File(self.path, mode="w")
+            array = self.h5.create_dataset(
+                dataset,
+                shape=shape,
+                maxshape=tuple(maxshape),
+                chunks=chunks,
+                dtype=dtype,
+                **_hdf5_compression(config.compression),
+            )
+
+            # The metadata is complete once the data is loaded
+            self.check_coords(cube, append, {})
+            array.attrs["climetlab"] = json.dumps(dict(coords=self.coords))
+
+        self.array = array
+        return self.chunk_writer(array, shape, offset)
 
     def close(self):
+        super().close()
         self.h5.close()
-        del self.h5
+        self.h5 = None
 
     def print_info(self):
         import h5py
@@ -363,11 +785,33 @@ class HDF5Loader:
             print("Content:")
             h5_tree(f, 1)
 
-    def add_metadata(self, config):
-        warnings.warn("HDF5Loader.add_metadata not yet implemented")
+    def ledger(self, parts):
+        return Ledger(f"{self.path}.climetlab-progress", parts)
+
+    def partition_range(self, part, parts):
+        axis = self.config.append_axis
+        return partition_range(
+            self.array.shape[axis], self.array.chunks[axis], part, parts
+        )
+
+    def add_metadata(self, config, parts=None):
+        import h5py
+
+        assert self.writer is None
+
+        self.config = config
+
+        if parts is not None and config.collect_statistics:
+            self.statistics_from_ledger(parts)
 
+        dataset = self.dataset or config.dataset
+        with h5py.File(self.path, mode="a") as f:
+            array = f[dataset]
+            previous = json.loads(array.attrs.get("climetlab", "{}"))
+            array.attrs["climetlab"] = json.dumps(self.metadata(config, previous))
 
-def _load(loader, config, append, **kwargs):
+
+def _load(loader, config, append, part=None, parts=None, **kwargs):
     start = time.time()
     print("Loading input", config.input)
 
@@ -389,22 +833,42 @@ def _load(loader, config, append, **kwargs):
     cube = cube.squeeze()
     print(f"Done in {seconds(time.time()-start)}.")
 
-    array = loader.create_array(config, cube, append)
+    array = loader.create_array(config, cube, append, partitioned=parts is not None)
+    statistics = array.statistics
+
+    reading_chunks = None
+    total = cube.count(reading_chunks)
+    cubelets = cube.iterate_cubelets(reading_chunks)
+
+    if parts is not None:
+        first, last = loader.partition_range(part, parts)
+        axis = config.append_axis
+        print(f"Loading partition {part}/{parts}: [{first}:{last}] along axis {axis}")
+        cubelets = [c for c in cubelets if first <= c.extended_icoords[axis] < last]
+        total = len(cubelets)
 
     start = time.time()
     load = 0
     save = 0
 
-    reading_chunks = None
-    for cubelet in progress_bar(
-        total=cube.count(reading_chunks),
-        iterable=cube.iterate_cubelets(reading_chunks),
-    ):
+    from climetlab.readers.grib.fieldset import missing_as_nan
+
+    def decode(cubelet):
         now = time.time()
         data = cubelet.to_numpy()
-        load += time.time() - now
+        # The statistics ignore the missing values
+        data = missing_as_nan(cubelet.owner[cubelet.coords], data)
+        return cubelet, data, time.time() - now
+
+    # The cubelets are decoded in threads while the previous ones are written.
+    # They are written in order, with a bounded number of decoded cubelets waiting.
+    nthreads = SETTINGS.get("number-of-decode-threads")
 
-        # print("data", data.shape,cubelet.extended_icoords)
+    for cubelet, data, elapsed in progress_bar(
+        total=total,
+        iterable=ordered_map(decode, cubelets, nthreads),
+    ):
+        load += elapsed
 
         now = time.time()
         array[cubelet.extended_icoords] = data
@@ -414,13 +878,17 @@ def _load(loader, config, append, **kwargs):
     loader.close()
     save += time.time() - now
 
+    if parts is not None:
+        # Only recorded once the data of the partition is written
+        loader.ledger(parts).record(part, statistics)
+
     print()
     loader.print_info()
     print()
 
     print(
         f"Elapsed: {seconds(time.time() - start)},"
-        f" load time: {seconds(load)},"
+        f" decode time: {seconds(load)} (all threads),"
         f" write time: {seconds(save)}."
     )
 
@@ -462,15 +930,87 @@ def expand(values):
     raise ValueError(f"Cannot expand loop from {values}")
 
 
-def load(loader, config, append=False, metadata_only=False, **kwargs):
+def _load_part(loader, config, part, parts, **kwargs):
+    # Runs in a separate process
+    _load(loader, Config(config), append=False, part=part, parts=parts, **kwargs)
+
+
+def _load_parts(loader, config, part=None, parts=None, processes=1, **kwargs):
+    if config.loop is not None:
+        raise NotImplementedError("Partitions are not supported with loops")
+
+    ledger = loader.ledger(parts)
+    todo = ledger.remaining()
+    if part is not None:
+        todo = [i for i in todo if i == part]
+
+    done = parts - len(ledger.remaining())
+    print(f"Partitions already loaded: {done}/{parts}, to load now: {todo}")
+
+    if processes > 1 and not loader.concurrent_writes:
+        raise ValueError(
+            f"{loader.__class__.__name__} cannot load partitions in several processes"
+        )
+
+    if processes > 1 and len(todo) > 1:
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        # Forking a process that has used the decoding threads can
+        # inherit locks that are held, so the workers are spawned
+        with ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=multiprocessing.get_context("spawn"),
+        ) as executor:
+            futures = [
+                executor.submit(_load_part, loader, config.config, i, parts, **kwargs)
+                for i in todo
+            ]
+            for future in futures:
+                future.result()
+    else:
+        for i in todo:
+            _load(loader, config, append=False, part=i, parts=parts, **kwargs)
+
+    # The last partition to finish, in any process, writes the metadata
+    if not ledger.remaining():
+        loader.add_metadata(config, parts=parts)
+
+
+def load(
+    loader,
+    config,
+    append=False,
+    metadata_only=False,
+    part=None,
+    parts=None,
+    processes=1,
+    **kwargs,
+):
+    """Loads the data described by `config` into the target of `loader`.
+
+    If `parts` is given, the target is split into that many partitions along its
+    append axis. Only the partitions that are not already loaded are processed,
+    so an interrupted creation can be resumed. With `part` (from 1), only that
+    partition is loaded, so several processes can fill a ZARR target concurrently.
+    The partitions of an HDF5 target must be loaded one at a time.
+    """
     config = Config(config)
 
+    if part is not None and parts is None:
+        raise ValueError("The number of partitions must be given with a partition")
+
     if metadata_only:
-        loader.add_metadata(config)
+        loader.add_metadata(config, parts=parts)
+        return
+
+    if parts is not None:
+        if append:
+            raise ValueError("Partitions cannot be used when appending")
+        _load_parts(loader, config, part, parts, processes, **kwargs)
         return
 
     if config.loop is None:
-        assert not append, "Not yet implemented"
         _load(loader, config, append, **kwargs)
         loader.add_metadata(config)
         return
@@ -68,6 +68,10 @@ class DirectoryReader(Reader):
         if os.path.exists(os.path.join(self.path, ".zattrs")):
             return load_source("zarr", self.path)
 
+        from climetlab.readers.grib.index import prescan_files
+
+        prescan_files(self._content)
+
         return load_source(
             "multi",
             [
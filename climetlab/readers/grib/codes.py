@@ -7,8 +7,10 @@
 # nor does it submit to any jurisdiction.
 #
 
+import atexit
 import datetime
 import logging
+import mmap
 import os
 import threading
 import time
@@ -28,72 +30,132 @@ def missing_is_none(x):
     return None if x == 2147483647 else x
 
 
-# This does not belong here, should be in the C library
-def get_messages_positions(path):
-    fd = os.open(path, os.O_RDONLY)
-    try:
-
-        def get(count):
-            buf = os.read(fd, count)
-            assert len(buf) == count
-            return int.from_bytes(
-                buf,
-                byteorder="big",
-                signed=False,
-            )
+def _get_int(buf, offset, count):
+    return int.from_bytes(
+        buf[offset : offset + count],
+        byteorder="big",
+        signed=False,
+    )
 
-        offset = 0
-        while True:
-            code = os.read(fd, 4)
-            if len(code) < 4:
-                break
 
-            if code != b"GRIB":
-                offset = os.lseek(fd, offset + 1, os.SEEK_SET)
-                continue
+def _message_length(buf, offset):
+    # `offset` points at the "GRIB" marker, returns the total length of
+    # the message, or None if the header is truncated
+    size = len(buf)
+    if offset + 16 > size:
+        return None
 
-            length = get(3)
-            edition = get(1)
+    length = _get_int(buf, offset + 4, 3)
+    edition = buf[offset + 7]
 
-            if edition == 1:
-                if length & 0x800000:
-                    sec1len = get(3)
-                    os.lseek(fd, 4, os.SEEK_CUR)
-                    flags = get(1)
-                    os.lseek(fd, sec1len - 8, os.SEEK_CUR)
+    if edition == 1:
+        if length & 0x800000:
+            # Large GRIB1 messages, see eccodes' grib_io.c
+            pos = offset + 8
+            if pos + 8 > size:
+                return None
 
-                    if flags & (1 << 7):
-                        sec2len = get(3)
-                        os.lseek(fd, sec2len - 3, os.SEEK_CUR)
+            sec1len = _get_int(buf, pos, 3)
+            flags = buf[pos + 7]
+            pos += sec1len
 
-                    if flags & (1 << 6):
-                        sec3len = get(3)
-                        os.lseek(fd, sec3len - 3, os.SEEK_CUR)
+            if flags & (1 << 7):
+                if pos + 3 > size:
+                    return None
+                pos += _get_int(buf, pos, 3)
 
-                    sec4len = get(3)
+            if flags & (1 << 6):
+                if pos + 3 > size:
+                    return None
+                pos += _get_int(buf, pos, 3)
 
-                    if sec4len < 120:
-                        length &= 0x7FFFFF
-                        length *= 120
-                        length -= sec4len
-                        length += 4
+            if pos + 3 > size:
+                return None
 
-            if edition == 2:
-                length = get(8)
+            sec4len = _get_int(buf, pos, 3)
 
-            yield offset, length
-            offset = os.lseek(fd, offset + length, os.SEEK_SET)
+            if sec4len < 120:
+                length &= 0x7FFFFF
+                length *= 120
+                length -= sec4len
+                length += 4
 
-    finally:
-        os.close(fd)
+    if edition == 2:
+        length = _get_int(buf, offset + 8, 8)
+
+    return length
+
+
+# This does not belong here, should be in the C library
+def get_messages_positions(path):
+    """Scan `path` for GRIB messages, returns two numpy int64 arrays
+    with the offsets and lengths of each message. The file is memory-mapped
+    and the "GRIB" markers are located with bulk searches, so padding
+    between messages is skipped without stepping one byte at a time.
+    A candidate message is only accepted if it ends with "7777".
+    """
+    import numpy as np
+
+    offsets = []
+    lengths = []
+
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size > 0:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                offset = buf.find(b"GRIB")
+                while offset >= 0:
+                    length = _message_length(buf, offset)
+
+                    if length is None or length < 16 or offset + length > size:
+                        # Truncated or spurious marker
+                        offset = buf.find(b"GRIB", offset + 1)
+                        continue
+
+                    end = offset + length
+                    if buf[end - 4 : end] != b"7777":
+                        LOG.debug("No end marker for GRIB at %s in %s", offset, path)
+                        offset = buf.find(b"GRIB", offset + 1)
+                        continue
+
+                    offsets.append(offset)
+                    lengths.append(length)
+                    offset = buf.find(b"GRIB", end)
+
+    return np.array(offsets, dtype=np.int64), np.array(lengths, dtype=np.int64)
 
 
 eccodes_codes_release = call_counter(eccodes.codes_release)
 eccodes_codes_new_from_file = call_counter(eccodes.codes_new_from_file)
 
 
+# Handles of the CodesHandle objects deleted by the garbage collector. They are
+# released later because the collector can run while the same thread holds the
+# (non reentrant) lock of the cffi bindings of eccodes, which would deadlock.
+_RELEASE_LATER = []
+
+
+def _release_pending_handles():
+    while _RELEASE_LATER:
+        try:
+            handle = _RELEASE_LATER.pop()
+        except IndexError:  # Emptied by another thread
+            break
+        try:
+            eccodes_codes_release(handle)
+        except TypeError:
+            # This happens when eccodes is unloaded before
+            # this object is deleted
+            pass
+
+
+# The last handles are released when the interpreter exits
+atexit.register(_release_pending_handles)
+
+
 class CodesHandle:
     def __init__(self, handle, path, offset):
+        _release_pending_handles()
         self.handle = handle
         self.path = path
         self.offset = offset
@@ -105,12 +167,7 @@ class CodesHandle:
         )
 
     def __del__(self):
-        try:
-            eccodes_codes_release(self.handle)
-        except TypeError:
-            # This happens when eccodes is unloaded before
-            # this object is deleted
-            pass
+        _RELEASE_LATER.append(self.handle)
 
     def get(self, name):
         try:
@@ -152,6 +209,19 @@ class CodesHandle:
         except eccodes.KeyValueNotFoundError:
             return None
 
+    def get_float_values(self):
+        # Decoded directly as float32, without a float64 intermediate.
+        # Returns None if this version of eccodes cannot decode floats.
+        import numpy as np
+
+        if not hasattr(eccodes, "codes_get_float_array"):
+            return None
+        values = eccodes.codes_get_float_array(self.handle, "values")
+        if values.dtype != np.float32:
+            # Some versions of eccodes return float64 arrays
+            values = values.astype(np.float32)
+        return values
+
     def get_long(self, name):
         try:
             return eccodes.codes_get_long(self.handle, name)
@@ -358,11 +428,19 @@ class GribField(Base):
 
     @call_counter
     def to_numpy(self, reshape=True, dtype=None):
-        values = self.values
+        import numpy as np
+
+        values = None
+        if self._values is None and dtype is not None and np.dtype(dtype) == np.float32:
+            values = self.handle.get_float_values()
+
+        if values is None:
+            values = self.values
+            if dtype is not None:
+                values = values.astype(dtype)
+
         if reshape:
             values = values.reshape(self.shape)
-        if dtype is not None:
-            values = values.astype(dtype)
         return values
 
     def __repr__(self):
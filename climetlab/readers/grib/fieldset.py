@@ -7,12 +7,18 @@
 # nor does it submit to any jurisdiction.
 #
 
+import hashlib
 import json
 import logging
+import math
 from collections import defaultdict
 
-from climetlab.core.caching import auxiliary_cache_file
+from climetlab.core.caching import auxiliary_cache_args, cache_file
+from climetlab.core.settings import SETTINGS
+from climetlab.core.thread import ordered_map
+from climetlab.readers.grib.codes import GribField
 from climetlab.utils.bbox import BoundingBox
+from climetlab.utils.stats import Statistics
 
 from .pandas import PandasMixIn
 from .pytorch import PytorchMixIn
@@ -22,6 +28,17 @@ from .xarray import XarrayMixIn
 LOG = logging.getLogger(__name__)
 
 
+def missing_as_nan(field, values):
+    """Returns the `values` decoded from `field`, with the points masked by the
+    bitmap of a GRIB field set to NaN. The values of other fields are unchanged.
+    """
+    import numpy as np
+
+    if isinstance(field, GribField) and field.metadata("bitmapPresent"):
+        values = np.where(values == field.metadata("missingValue"), np.nan, values)
+    return values
+
+
 class FieldSetMixin(PandasMixIn, XarrayMixIn, PytorchMixIn, TensorflowMixIn):
     _statistics = None
 
@@ -29,7 +46,7 @@ class FieldSetMixin(PandasMixIn, XarrayMixIn, PytorchMixIn, TensorflowMixIn):
         from climetlab.indexing.database import GRIB_KEYS_NAMES
 
         coords = defaultdict(set)
-        for f in self:
+        for f in self._iter_lazy():
             for k in GRIB_KEYS_NAMES:
                 v = f.metadata(k)
                 if v is None:
@@ -58,11 +75,6 @@ class FieldSetMixin(PandasMixIn, XarrayMixIn, PytorchMixIn, TensorflowMixIn):
 
         return mv_read(self.path)
 
-    def to_numpy(self, **kwargs):
-        import numpy as np
-
-        return np.array([f.to_numpy(**kwargs) for f in self])
-
     def plot_map(self, backend):
         return self.first.plot_map(backend)
 
@@ -75,73 +87,70 @@ class FieldSetMixin(PandasMixIn, XarrayMixIn, PytorchMixIn, TensorflowMixIn):
     def to_datetime_list(self):
         # TODO: check if that can be done faster
         result = set()
-        for s in self:
+        for s in self._iter_lazy():
             result.add(s.valid_datetime())
         return sorted(result)
 
     def to_bounding_box(self):
-        return BoundingBox.multi_merge([s.to_bounding_box() for s in self])
+        return BoundingBox.multi_merge([s.to_bounding_box() for s in self._iter_lazy()])
+
+    def _statistics_cache_args(self):
+        # The cache is invalidated if any of the files is changed,
+        # or if the fields are not the same
+        m = hashlib.md5()
+        paths = {}
+        for f in self._iter_lazy():
+            path = getattr(f, "path", None)
+            if path is None or getattr(f, "_offset", None) is None:
+                return None
+            if path not in paths:
+                paths[path] = auxiliary_cache_args(path)
+            m.update(f"{path}:{f._offset}:{f._length};".encode("utf-8"))
+
+        return dict(files=sorted(paths.values()), fields=m.hexdigest())
+
+    def _compute_statistics(self):
+        n = len(self)
+        assert n, "Cannot compute the statistics of an empty fieldset"
+        nthreads = min(SETTINGS.get("number-of-decode-threads"), n)
+        size = max(1, math.ceil(n / (4 * nthreads)))
+        chunks = [range(i, min(i + size, n)) for i in range(0, n, size)]
+
+        def chunk_statistics(chunk):
+            stats = Statistics()
+            for i in chunk:
+                field = self[i]
+                stats.add(missing_as_nan(field, field.values))
+            return stats
+
+        result = Statistics()
+        for stats in ordered_map(chunk_statistics, chunks, nthreads):
+            result.merge(stats)
+
+        return dict(
+            minimum=float(result.minimum),
+            maximum=float(result.maximum),
+            average=float(result.mean),
+            stdev=float(result.stdev),
+            count=n,
+        )
 
     def statistics(self):
-        import numpy as np
-
         if self._statistics is not None:
             return self._statistics
 
-        if False:
-            cache = auxiliary_cache_file(
-                "grib-statistics--",
-                self.path,
-                content="null",
-                extension=".json",
-            )
-
-            with open(cache) as f:
-                self._statistics = json.load(f)
-
-            if self._statistics is not None:
-                return self._statistics
-
-        stdev = None
-        average = None
-        maximum = None
-        minimum = None
-        count = 0
-
-        for s in self:
-            v = s.values
-            if count:
-                stdev = np.add(stdev, np.multiply(v, v))
-                average = np.add(average, v)
-                maximum = np.maximum(maximum, v)
-                minimum = np.minimum(minimum, v)
-            else:
-                stdev = np.multiply(v, v)
-                average = v
-                maximum = v
-                minimum = v
-
-            count += 1
-
-        nans = np.count_nonzero(np.isnan(average))
-        assert nans == 0, "Statistics with missing values not yet implemented"
-
-        maximum = np.amax(maximum)
-        minimum = np.amin(minimum)
-        average = np.mean(average) / count
-        stdev = np.sqrt(np.mean(stdev) / count - average * average)
-
-        self._statistics = dict(
-            minimum=minimum,
-            maximum=maximum,
-            average=average,
-            stdev=stdev,
-            count=count,
-        )
+        args = self._statistics_cache_args()
+        if args is None:
+            self._statistics = self._compute_statistics()
+            return self._statistics
+
+        def create(target, args):
+            with open(target, "w") as f:
+                json.dump(self._compute_statistics(), f)
 
-        if False:
-            with open(cache, "w") as f:
-                json.dump(self._statistics, f)
+        path = cache_file("grib-statistics", create, args, extension=".json")
+        with open(path) as f:
+            self._statistics = json.load(f)
 
         return self._statistics
 
@@ -150,5 +159,5 @@ class FieldSetMixin(PandasMixIn, XarrayMixIn, PytorchMixIn, TensorflowMixIn):
             self.write(f)
 
     def write(self, f):
-        for s in self:
+        for s in self._iter_lazy():
             s.write(f)
@@ -13,6 +13,8 @@ import os
 from abc import abstractmethod
 
 from climetlab.core.index import Index, MaskIndex, MultiIndex
+from climetlab.core.settings import SETTINGS
+from climetlab.core.thread import SoftThreadPool
 from climetlab.decorators import alias_argument
 from climetlab.indexing.database import (
     FILEPARTS_KEY_NAMES,
@@ -22,7 +24,7 @@ from climetlab.indexing.database import (
 )
 from climetlab.readers.grib.codes import GribField
 from climetlab.readers.grib.fieldset import FieldSetMixin
-from climetlab.utils import progress_bar
+from climetlab.utils import progress_bar, tqdm
 from climetlab.utils.availability import Availability
 
 LOG = logging.getLogger(__name__)
@@ -43,6 +45,14 @@ class FieldSet(FieldSetMixin, Index):
     def new_mask_index(self, *args, **kwargs):
         return MaskFieldSet(*args, **kwargs)
 
+    def _prefetch(self, n):
+        field = self[n]
+        if isinstance(field, GribField):
+            # Read the message, but leave the decoding of the values to the
+            # caller, that may want them as float32
+            field.handle
+        return field
+
     @property
     def availability_path(self):
         return None
@@ -137,3 +147,39 @@ class FieldSetInFiles(FieldSet):
     @abstractmethod
     def number_of_parts(self):
         self._not_implemented()
+
+
+def _is_grib(path):
+    try:
+        with open(path, "rb") as f:
+            return f.read(4) == b"GRIB"
+    except OSError:
+        return False
+
+
+def prescan_files(paths):
+    """Build the message indexes of the GRIB files in `paths` in parallel,
+    using up to `number-of-scan-threads` threads. The indexes are stored
+    in the cache, so that opening each file afterwards does not scan it again.
+    """
+    from climetlab.readers.grib.index.file import FieldSetInOneFile
+
+    nthreads = min(SETTINGS.get("number-of-scan-threads"), len(paths))
+    if nthreads < 2:
+        return
+
+    paths = [p for p in paths if _is_grib(p)]
+
+    def _scan(path):
+        try:
+            FieldSetInOneFile(path)
+        except Exception:
+            # The file will be scanned again when opened
+            LOG.exception("Cannot scan %s", path)
+
+    with SoftThreadPool(nthreads=nthreads) as pool:
+        futures = [pool.submit(_scan, p) for p in paths]
+
+        iterator = (f.result() for f in futures)
+        for _ in tqdm(iterator, leave=False, total=len(futures), desc="Scanning"):
+            pass
@@ -12,7 +12,13 @@ import json
 import logging
 import os
 
-from climetlab.core.caching import auxiliary_cache_file
+import numpy as np
+
+from climetlab.core.caching import (
+    auxiliary_cache_file,
+    auxiliary_cache_file_path,
+    decache_file,
+)
 from climetlab.readers.grib.codes import get_messages_positions
 from climetlab.readers.grib.index import FieldSetInFiles
 from climetlab.utils.parts import Part
@@ -20,8 +26,23 @@ from climetlab.utils.parts import Part
 LOG = logging.getLogger(__name__)
 
 
+def _valid_messages(path, offsets, lengths):
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        for offset, length in zip(offsets.tolist(), lengths.tolist()):
+            if offset < 0 or length < 8 or offset + length > size:
+                return False
+            f.seek(offset)
+            if f.read(4) != b"GRIB":
+                return False
+            f.seek(offset + length - 4)
+            if f.read(4) != b"7777":
+                return False
+    return True
+
+
 class FieldSetInOneFile(FieldSetInFiles):
-    VERSION = 1
+    VERSION = 2
 
     @property
     def availability_path(self):
@@ -36,60 +57,88 @@ class FieldSetInOneFile(FieldSetInFiles):
         self.mappings_cache_file = auxiliary_cache_file(
             "grib-index",
             path,
-            content="null",
-            extension=".json",
+            extension=".npz",
         )
 
         if not self._load_cache():
-            self._build_offsets_lengths_mapping()
+            if not self._migrate_json_cache():
+                self._build_offsets_lengths_mapping()
+            self._save_cache()
 
         super().__init__(**kwargs)
 
     def _build_offsets_lengths_mapping(self):
-        offsets = []
-        lengths = []
-
-        for offset, length in get_messages_positions(self.path):
-            offsets.append(offset)
-            lengths.append(length)
-
-        self.offsets = offsets
-        self.lengths = lengths
-
-        self._save_cache()
+        self.offsets, self.lengths = get_messages_positions(self.path)
 
     def _save_cache(self):
+        # Uncompressed, so that each array is loaded with a single read
         try:
-            with open(self.mappings_cache_file, "w") as f:
-                json.dump(
-                    dict(
-                        version=self.VERSION,
-                        offsets=self.offsets,
-                        lengths=self.lengths,
-                    ),
+            with open(self.mappings_cache_file, "wb") as f:
+                np.savez(
                     f,
+                    version=np.int64(self.VERSION),
+                    offsets=self.offsets,
+                    lengths=self.lengths,
                 )
         except Exception:
             LOG.exception("Write to cache failed %s", self.mappings_cache_file)
 
     def _load_cache(self):
         try:
-            with open(self.mappings_cache_file) as f:
-                c = json.load(f)
-                if not isinstance(c, dict):
+            if os.path.getsize(self.mappings_cache_file) == 0:
+                # Freshly created by auxiliary_cache_file()
+                return False
+
+            with np.load(self.mappings_cache_file, allow_pickle=False) as c:
+                if int(c["version"]) != self.VERSION:
                     return False
 
-                assert c["version"] == self.VERSION
-                self.offsets = c["offsets"]
-                self.lengths = c["lengths"]
+                self.offsets = c["offsets"].astype(np.int64, copy=False)
+                self.lengths = c["lengths"].astype(np.int64, copy=False)
                 return True
         except Exception:
             LOG.exception("Load from cache failed %s", self.mappings_cache_file)
 
         return False
 
+    def _migrate_json_cache(self):
+        # Older versions stored the offsets and lengths in a JSON file.
+        # Reuse it if it is still valid, and remove it from the cache.
+        json_cache_file = auxiliary_cache_file_path(
+            "grib-index",
+            self.path,
+            extension=".json",
+        )
+        if not os.path.exists(json_cache_file):
+            return False
+
+        try:
+            with open(json_cache_file) as f:
+                c = json.load(f)
+
+            if not isinstance(c, dict) or c.get("version") not in (1, 2):
+                return False
+
+            offsets = np.asarray(c["offsets"], dtype=np.int64)
+            lengths = np.asarray(c["lengths"], dtype=np.int64)
+
+            # Version 1 was built by an older scanner, that could accept
+            # invalid messages, so check that they are all complete
+            if not _valid_messages(self.path, offsets, lengths):
+                return False
+
+            self.offsets, self.lengths = offsets, lengths
+            LOG.debug("Migrated %s to %s", json_cache_file, self.mappings_cache_file)
+            return True
+        except Exception:
+            LOG.exception("Migration from cache failed %s", json_cache_file)
+        finally:
+            decache_file(json_cache_file)
+
+        return False
+
     def part(self, n):
-        return Part(self.path, self.offsets[n], self.lengths[n])
+        return Part(self.path, int(self.offsets[n]), int(self.lengths[n]))
 
     def number_of_parts(self):
         return len(self.offsets)
@@ -16,6 +16,7 @@ from climetlab.core.select import normalize_selection
 from climetlab.decorators import cached_method, normalize
 from climetlab.indexing.database.sql import (
     SqlDatabase,
+    SqlMaterialisation,
     SqlOrder,
     SqlRemapping,
     SqlSelection,
@@ -95,6 +96,12 @@ class FieldsetInFilesWithSqlIndex(FieldsetInFilesWithDBIndex):
 
         return out
 
+    def materialise(self):
+        """Evaluates the selections and orders once, and stores the resulting
+        entries in a temporary table. Subsequent accesses, `len()` and
+        `unique_values()` do not evaluate the chain of views again."""
+        return self.filter(SqlMaterialisation())
+
     def part(self, n):
         if self._cache is None or not (
             self._cache.first <= n < self._cache.first + self._cache.length
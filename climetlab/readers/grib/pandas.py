@@ -28,7 +28,7 @@ class PandasMixIn:
             filter = select_point
 
         frames = []
-        for s in self:
+        for s in self._iter_lazy():
             df = pd.DataFrame(filter(s.data))
             df["datetime"] = s.valid_datetime()
             for k, v in s.as_mars().items():
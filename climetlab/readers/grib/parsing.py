@@ -10,9 +10,9 @@ import datetime
 import fnmatch
 import logging
 import os
+import queue
 import sys
-import time
-from multiprocessing import Process, Queue
+from multiprocessing import Event, Process, Queue
 
 from tqdm import tqdm
 
@@ -152,8 +152,13 @@ def _index_path(path):
 class GribIndexingDirectoryParserIterator:
     """This class delays parsing the directory for the list of files
     until the iterator is actually used (calling __iter__)
+
+    The files are parsed by `n_proc` processes (defaults to the number of CPUs),
+    the parsed entries are written to the database by the calling process.
     """
 
+    BATCH_SIZE = 100_000
+
     def __init__(
         self,
         directory,
@@ -163,6 +168,7 @@ class GribIndexingDirectoryParserIterator:
         followlinks=True,
         verbose=False,
         with_statistics=True,
+        n_proc=None,
     ):
         self.db_path = db_path
         if ignore is None:
@@ -173,6 +179,7 @@ class GribIndexingDirectoryParserIterator:
         self.followlinks = followlinks
         self.verbose = verbose
         self.with_statistics = with_statistics
+        self.n_proc = n_proc
 
         self._tasks = None
 
@@ -182,66 +189,162 @@ class GribIndexingDirectoryParserIterator:
         return SqlDatabase(self.db_path)
 
     def worker(self, i):
-        _i = i
-        time.sleep(i)
         while True:
-            task = self.q_in.get()
-            if task is None:
+            path = self.q_in.get()
+            if path is None:
                 break
-            n = self.process_path(_i, task)
-            self.q_out.put(n)
-
-    def load_database(self):
-        start = datetime.datetime.now()
-
-        n_proc = 5
-        if sys.platform == "win32":
-            n_proc = 1  # deactivate multiprocessing for window
+            if self.stopped.is_set():
+                # The caller has stopped, skip the remaining paths
+                continue
+            self.q_out.put(self.parse_path(i, path))
 
+    def _parse_paths(self, paths, n_proc):
+        # Yields each path with its list of entries, in any order
         if n_proc == 1:
-            count = 0
-            for path in self.tasks:
-                count += self.process_path(0, path)
-        else:
-            assert n_proc > 1, n_proc
-
-            self.q_in = Queue()
-            self.q_out = Queue()
-
-            workers = []
-            for i in range(n_proc):
-                proc = Process(target=self.worker, args=(i,))
-                proc.start()
-                workers.append(proc)
-
-            for path in self.tasks:
+            for path in paths:
+                yield self.parse_path(0, path)
+            return
+
+        self.q_in = Queue()
+        # Bound the number of parsed files waiting for the writer
+        self.q_out = Queue(maxsize=2 * n_proc)
+        self.stopped = Event()
+
+        # Daemon workers do not keep the interpreter alive if the
+        # caller stops without draining the queue
+        workers = []
+        for i in range(n_proc):
+            proc = Process(target=self.worker, args=(i,), daemon=True)
+            proc.start()
+            workers.append(proc)
+
+        completed = False
+        try:
+            for path in paths:
                 self.q_in.put(path)
 
             for i in range(n_proc):
                 self.q_in.put(None)
 
-            count = 0
-            for _ in progress_bar(iterable=self.tasks, total=len(self.tasks)):
-                count += self.q_out.get()
+            for _ in paths:
+                yield self.q_out.get()
+
+            completed = True
+
+        finally:
+            if not completed:
+                # The caller raised or stopped iterating early. The workers are
+                # not terminated, as they could hold a lock shared with this
+                # process (e.g. the one of tqdm), but told to stop, and the
+                # ones blocked on the bounded output queue are unblocked.
+                self.stopped.set()
+                for i in range(n_proc):
+                    self.q_in.put(None)
+                while any(p.is_alive() for p in workers):
+                    try:
+                        self.q_out.get(timeout=0.1)
+                    except queue.Empty:
+                        pass
 
             for p in workers:
                 p.join()
 
             del self.q_in
             del self.q_out
+            del self.stopped
 
-        self._new_db().build_indexes()
+    def load_database(self):
+        start = datetime.datetime.now()
 
-        end = datetime.datetime.now()
-        print(f"Indexed {plural(count,'field')} in {seconds(end - start)}.")
+        n_proc = self.n_proc
+        if n_proc is None:
+            n_proc = os.cpu_count() or 1
+        if sys.platform == "win32":
+            n_proc = 1  # deactivate multiprocessing for window
+        assert n_proc >= 1, n_proc
 
-    def process_path(self, i, path):
+        # The parsers only read the files, this process is the only
+        # one writing to the database.
         db = self._new_db()
 
-        if db.already_loaded(self._format_path(path), self):
-            LOG.warning(f"Skipping {path}, already loaded")
-            return 0
+        # Only parse the files that are new or have changed since they
+        # were indexed, and forget the ones that have been deleted
+        known = db.paths_stats()
+        stats = {}
+        paths = []
+        changed = []
+        backfill = {}
+        for path in self.tasks:
+            key = self._format_path(path)
+            st = os.stat(path)
+            stats[key] = (st.st_size, st.st_mtime)
+            if key in known:
+                if known[key] == (None, None):
+                    # Indexed by a version that did not record the
+                    # files stats, assume the file has not changed
+                    backfill[key] = stats[key]
+                    continue
+                if known[key] == stats[key]:
+                    LOG.debug(f"Skipping {path}, already loaded")
+                    continue
+                changed.append(key)
+            paths.append(path)
+
+        if backfill:
+            db.set_paths_stats(backfill)
+
+        # The database may also index files outside of this directory,
+        # or files that this scan ignores
+        deleted = [key for key in known if key not in stats and self._scanned(key)]
+        if changed or deleted:
+            LOG.info(
+                f"Removing {plural(len(changed), 'changed file')}"
+                f" and {plural(len(deleted), 'deleted file')} from the index"
+            )
+            db.remove_paths(changed + deleted)
+
+        if self.verbose:
+            print(f"{plural(len(paths), 'file')} to index.")
+
+        n_proc = max(1, min(n_proc, len(paths)))
+
+        count = 0
+        batch = []
+        loaded = {}
+
+        def flush():
+            nonlocal count, batch, loaded
+            if batch:
+                count += db.load_iterator(batch)
+            if loaded:
+                db.set_paths_stats(loaded)
+            batch = []
+            loaded = {}
+
+        for path, entries in progress_bar(
+            iterable=self._parse_paths(paths, n_proc),
+            total=len(paths),
+        ):
+            if entries is None:
+                # Parsing failed, try again next time
+                continue
+
+            # Entries of a given path are always in the same batch
+            batch.extend(entries)
+            key = self._format_path(path)
+            loaded[key] = stats[key]
+
+            if len(batch) >= self.BATCH_SIZE:
+                flush()
+
+        flush()
+
+        db.build_indexes()
+
+        end = datetime.datetime.now()
+        print(f"Indexed {plural(count,'field')} in {seconds(end - start)}.")
 
+    def parse_path(self, i, path):
         lst = []
         LOG.debug(f"Parsing file {path}")
 
@@ -255,16 +358,15 @@ class GribIndexingDirectoryParserIterator:
                 lst.append(field)
         except PermissionError as e:
             LOG.error(f"Could not read {path}: {e}")
-            return 0
+            return path, None
         except Exception as e:
             LOG.exception(f"(grib-parsing) Ignoring {path}, {e}")
-            return 0
+            return path, None
 
         if not lst:
             LOG.warn(f"No entry found in {path}.")
-            return 0
 
-        return db.load_iterator(lst)
+        return path, lst
 
     @property
     def tasks(self):
@@ -275,17 +377,11 @@ class GribIndexingDirectoryParserIterator:
         assert os.path.exists(self.directory), f"{self.directory} does not exist"
         assert os.path.isdir(self.directory), f"{self.directory} is not a directory"
 
-        def _ignore(path):
-            for ignore in self.ignore:
-                if fnmatch.fnmatch(os.path.basename(path), ignore):
-                    return True
-            return False
-
         tasks = []
         for root, _, files in os.walk(self.directory, followlinks=self.followlinks):
             for name in files:
                 path = os.path.join(root, name)
-                if _ignore(path):
+                if self._ignored(path):
                     continue
                 tasks.append(path)
         tasks = sorted(tasks)
@@ -300,6 +396,22 @@ class GribIndexingDirectoryParserIterator:
 
         return self.tasks
 
+    def _ignored(self, path):
+        for ignore in self.ignore:
+            if fnmatch.fnmatch(os.path.basename(path), ignore):
+                return True
+        return False
+
+    def _scanned(self, key):
+        # Whether a path of the database is one that the scan would find
+        if self.relative_paths is True:
+            key = os.path.join(self.directory, key)
+        path = os.path.abspath(key)
+        directory = os.path.abspath(self.directory)
+        if os.path.commonpath([path, directory]) != directory:
+            return False
+        return not self._ignored(path)
+
     def _format_path(self, path):
         return {
             None: lambda x: x,
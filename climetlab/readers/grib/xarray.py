@@ -11,6 +11,8 @@ import logging
 import math
 import warnings
 
+from climetlab.core.settings import SETTINGS
+from climetlab.core.thread import ordered_map
 from climetlab.utils.kwargs import Kwargs
 from climetlab.utils.serialise import deserialise_state, serialise_state
 
@@ -18,22 +20,28 @@ LOG = logging.getLogger(__name__)
 
 
 class ItemWrapperForCfGrib:
-    def __init__(self, item, ignore_keys=[]):
+    def __init__(self, item, ignore_keys=[], index=None, position=None):
         self.item = item
         self.ignore_keys = ignore_keys
+        self.index = index
+        self.position = position
 
     def __getitem__(self, n):
         if n in self.ignore_keys:
             return None
         if n == "values":
+            if self.index is not None:
+                return self.index.values(self.position)
             return self.item.values
         return self.item.metadata(n)
 
 
 class IndexWrapperForCfGrib:
-    def __init__(self, index=None, ignore_keys=[]):
+    def __init__(self, index=None, ignore_keys=[], nthreads=1):
         self.index = index
         self.ignore_keys = ignore_keys
+        self.nthreads = nthreads
+        self.preloaded = {}
 
     def __getstate__(self):
         return dict(index=serialise_state(self.index), ignore_keys=self.ignore_keys)
@@ -41,11 +49,32 @@ class IndexWrapperForCfGrib:
     def __setstate__(self, state):
         self.index = deserialise_state(state["index"])
         self.ignore_keys = state["ignore_keys"]
+        self.nthreads = 1
+        self.preloaded = {}
+
+    def values(self, n):
+        if n not in self.preloaded:
+            # cfgrib usually reads the fields in order, so the next ones are
+            # decoded in threads. Only that window is kept, the fields of
+            # the previous one that cfgrib has skipped are dropped.
+            positions = range(n, min(n + 4 * self.nthreads, len(self.index)))
+            self.preloaded = dict(
+                zip(
+                    positions,
+                    ordered_map(
+                        lambda i: self.index[i].values, positions, self.nthreads
+                    ),
+                )
+            )
+        # Only kept until cfgrib has copied them
+        return self.preloaded.pop(n)
 
     def __getitem__(self, n):
         return ItemWrapperForCfGrib(
             self.index[n],
             ignore_keys=self.ignore_keys,
+            index=self if self.nthreads > 1 else None,
+            position=n,
         )
 
     def __len__(self):
@@ -103,8 +132,17 @@ class XarrayMixIn:
             )
         )
 
+        nthreads = 1
+        if (
+            xarray_open_dataset_kwargs.get("cache")
+            and xarray_open_dataset_kwargs.get("chunks") is None
+        ):
+            # The values are loaded by a single reader, when first
+            # accessed. Decode them in threads ahead of it.
+            nthreads = min(SETTINGS.get("number-of-decode-threads"), len(self))
+
         result = xr.open_dataset(
-            IndexWrapperForCfGrib(self, ignore_keys=ignore_keys),
+            IndexWrapperForCfGrib(self, ignore_keys=ignore_keys, nthreads=nthreads),
             **xarray_open_dataset_kwargs,
         )
 
@@ -9,7 +9,7 @@
 
 import os
 
-from climetlab.loaders import HDF5Loader, ZarrLoader, load
+from climetlab.loaders import HDF5Loader, ZarrLoader, load, parse_part
 from climetlab.utils.humanize import list_to_human
 
 from .tools import parse_args
@@ -49,8 +49,50 @@ class LoadersCmd:
             "--metadata",
             dict(action="store_true", help="Update metadata."),
         ),
+        append=(
+            "--append",
+            dict(
+                action="store_true",
+                help="Append the data to an existing target, along its first dimension.",
+            ),
+        ),
+        parts=(
+            "--parts",
+            dict(
+                type=int,
+                help="Split the target into that many partitions along its first"
+                " dimension. Partitions already loaded are skipped, so an interrupted"
+                " creation can be resumed.",
+            ),
+        ),
+        part=(
+            "--part",
+            dict(
+                help="Only load the partition i/N (from 1), so that several"
+                " invocations can fill a ZARR target concurrently."
+                " The partitions of an HDF5 target must be loaded one at a time.",
+            ),
+        ),
+        processes=(
+            "--processes",
+            dict(
+                type=int,
+                default=1,
+                help="Number of processes loading the partitions of a ZARR"
+                " target (default 1).",
+            ),
+        ),
     )
     def do_create(self, args):
+        """Create a ZARR or HDF5 target from the data described in a config.
+
+        With --append, the data is added to an existing target. The other
+        coordinates must match, and the statistics are updated.
+
+        With --parts N, the target is filled one partition at a time, and an
+        interrupted creation resumes from the partitions not yet loaded.
+        Use --part i/N to load the partitions in separate invocations.
+        """
         if args.format is None:
             _, ext = os.path.splitext(args.target)
             args.format = ext[1:]
@@ -65,9 +107,23 @@ class LoadersCmd:
             lst = list_to_human(list(LOADERS.keys()), "or")
             raise ValueError(f"Invalid format '{args.format}', must be one of {lst}.")
 
+        part, parts = None, args.parts
+        if args.part is not None:
+            part, parts = parse_part(args.part)
+            if args.parts is not None and args.parts != parts:
+                raise ValueError(f"Partition {args.part} inconsistent with --parts")
+
+        if LOADERS[args.format] is HDF5Loader:
+            loader = HDF5Loader(args.target, dataset=args.dataset)
+        else:
+            loader = LOADERS[args.format](args.target)
+
         return load(
-            LOADERS[args.format](args.target),
+            loader,
             args.config,
-            dataset=args.dataset,
+            append=args.append,
             metadata_only=args.metadata,
+            part=part,
+            parts=parts,
+            processes=args.processes,
         )
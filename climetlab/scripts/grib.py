@@ -89,9 +89,15 @@ class GribCmd:
                 help="Custom location of the database file, will write absolute filenames in the database."
             ),
         ),
+        processes=dict(
+            type=int,
+            help="Number of processes used to parse the GRIB files. Default is the number of CPUs.",
+        ),
     )
     def do_index_directory(self, args):
-        """Index a directory containing GRIB files."""
+        """Index a directory containing GRIB files.
+        If the index already exists, only new or modified files are parsed
+        and the entries of deleted files are removed."""
 
         if sys.platform == "win32":
             print("Not supported on windows")
@@ -141,6 +147,7 @@ class GribCmd:
             relative_paths=relative_paths,
             followlinks=followlinks,
             with_statistics=True,
+            n_proc=args.processes,
         )
         parser.load_database()
 
@@ -42,6 +42,10 @@ class FileSource(Source, os.PathLike, metaclass=FileSourceMeta):
             if len(self.path) == 1:
                 self.path = self.path[0]
             else:
+                from climetlab.readers.grib.index import prescan_files
+
+                prescan_files(self.path)
+
                 return load_source(
                     "multi",
                     [load_source("file", p) for p in self.path],
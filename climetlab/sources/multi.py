@@ -7,6 +7,7 @@
 # nor does it submit to any jurisdiction.
 #
 
+import bisect
 import itertools
 import logging
 
@@ -32,6 +33,7 @@ class MultiSource(Source):
         self.filter = filter
         self.merger = merger
         self._lengths = [None] * len(self.sources)
+        self._cumulative_lengths = None
 
     def ignore(self):
         return len(self.sources) == 0
@@ -59,14 +61,15 @@ class MultiSource(Source):
         return itertools.chain(*self.sources)
 
     def __getitem__(self, n):
+        offsets = self._offsets()
         if n < 0:
-            n = len(self) + n
+            n = offsets[-1] + n
 
-        i = 0
-        while n >= self._length(i):
-            n -= self._length(i)
-            i += 1
-        return self.sources[i][n]
+        if not 0 <= n < offsets[-1]:
+            raise IndexError(n)
+
+        i = bisect.bisect_right(offsets, n) - 1
+        return self.sources[i][n - offsets[i]]
 
     def sel(self, *args, **kwargs):
         new_sources = [s.sel(*args, **kwargs) for s in self.sources]
@@ -77,13 +80,21 @@ class MultiSource(Source):
         return self.__class__(new_sources, filter=self.filter, merger=self.merger)
 
     def __len__(self):
-        return sum(self._length(i) for i, _ in enumerate(self.sources))
+        return self._offsets()[-1]
 
     def _length(self, i):
         if self._lengths[i] is None:
             self._lengths[i] = len(self.sources[i])
         return self._lengths[i]
 
+    def _offsets(self):
+        # Position of the first element of each source, then the total length
+        if self._cumulative_lengths is None:
+            self._cumulative_lengths = [0] + list(
+                itertools.accumulate(self._length(i) for i in range(len(self.sources)))
+            )
+        return self._cumulative_lengths
+
     def __repr__(self) -> str:
         string = ",".join(repr(s) for s in self.sources)
         return f"{self.__class__.__name__}({string})"
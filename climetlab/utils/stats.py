@@ -0,0 +1,151 @@
+# (C) Copyright 2023 ECMWF.
+#
+# This software is licensed under the terms of the Apache Licence Version 2.0
+# which can be obtained at http://www.apache.org/licenses/LICENSE-2.0.
+# In applying this licence, ECMWF does not waive the privileges and immunities
+# granted to it by virtue of its status as an intergovernmental organisation
+# nor does it submit to any jurisdiction.
+#
+
+import numpy as np
+
+
+def _summary(values):
+    # Count, mean, sum of squared deviations, minimum and maximum
+    # of the values that are not missing (NaN)
+    values = values[~np.isnan(values)]
+    if values.size == 0:
+        return 0, 0.0, 0.0, np.inf, -np.inf
+
+    mean = np.mean(values)
+    deviations = values - mean
+    return (
+        values.size,
+        mean,
+        np.dot(deviations, deviations),
+        np.amin(values),
+        np.amax(values),
+    )
+
+
+class Statistics:
+    """Streaming statistics of arrays of values, ignoring missing values (NaN).
+
+    If `axis` is None, the statistics are computed over all the values. Otherwise,
+    they are computed for each index along `axis` (e.g. for each variable), and the
+    attributes are arrays of `size` elements.
+
+    The mean and the variance are updated with the algorithm of Chan et al., which
+    does not accumulate sums of squares, and two instances computed on different
+    parts of the data (e.g. in different threads) can be merged.
+    """
+
+    def __init__(self, axis=None, size=None):
+        self.axis = axis
+        shape = () if axis is None else (size,)
+        self.count = np.zeros(shape, dtype=np.int64)
+        self.mean = np.zeros(shape)
+        self.m2 = np.zeros(shape)
+        self._minimum = np.full(shape, np.inf)
+        self._maximum = np.full(shape, -np.inf)
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64)
+
+        if self.axis is None:
+            self._merge(..., *_summary(values.reshape(-1)))
+            return self
+
+        n = values.shape[self.axis]
+        assert self.count.shape == (n,), (self.count.shape, values.shape, self.axis)
+
+        summaries = [
+            _summary(np.take(values, i, axis=self.axis).reshape(-1)) for i in range(n)
+        ]
+        self._merge(..., *[np.array(x) for x in zip(*summaries)])
+        return self
+
+    def merge(self, other, start=None):
+        """Merges the statistics of `other`. If `start` is given, `other` has
+        the statistics of the indices from `start` along the axis."""
+        index = ... if start is None else slice(start, start + len(other.count))
+        self._merge(
+            index,
+            other.count,
+            other.mean,
+            other.m2,
+            other._minimum,
+            other._maximum,
+        )
+        return self
+
+    def _merge(self, index, count, mean, m2, minimum, maximum):
+        total = self.count[index] + count
+        with np.errstate(invalid="ignore", divide="ignore"):
+            fraction = np.where(total > 0, count / total, 0.0)
+        delta = mean - self.mean[index]
+
+        self.m2[index] += m2 + delta * delta * self.count[index] * fraction
+        self.mean[index] += delta * fraction
+        self.count[index] = total
+        self._minimum[index] = np.fmin(self._minimum[index], minimum)
+        self._maximum[index] = np.fmax(self._maximum[index], maximum)
+
+    def state(self):
+        """Returns the accumulators, from which the statistics can be
+        updated later, see from_state()."""
+        return dict(
+            count=self.count,
+            mean=self.mean,
+            m2=self.m2,
+            minimum=self._minimum,
+            maximum=self._maximum,
+        )
+
+    @classmethod
+    def from_state(cls, state, axis=None):
+        count = np.asarray(state["count"], dtype=np.int64)
+        stats = cls(axis=axis, size=None if axis is None else count.size)
+        stats.count = count
+        stats.mean = np.asarray(state["mean"], dtype=np.float64)
+        stats.m2 = np.asarray(state["m2"], dtype=np.float64)
+        stats._minimum = np.asarray(state["minimum"], dtype=np.float64)
+        stats._maximum = np.asarray(state["maximum"], dtype=np.float64)
+        return stats
+
+    def save(self, path):
+        np.savez(path, **self.state())
+
+    @classmethod
+    def load(cls, path, axis=None):
+        with np.load(path) as f:
+            return cls.from_state(f, axis=axis)
+
+    def _missing_to_nan(self, x):
+        return np.where(self.count > 0, x, np.nan)
+
+    @property
+    def minimum(self):
+        return self._missing_to_nan(self._minimum)
+
+    @property
+    def maximum(self):
+        return self._missing_to_nan(self._maximum)
+
+    @property
+    def variance(self):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return self._missing_to_nan(self.m2 / self.count)
+
+    @property
+    def stdev(self):
+        return np.sqrt(self.variance)
+
+    def as_dict(self):
+        return dict(
+            count=self.count.tolist(),
+            minimum=self.minimum.tolist(),
+            maximum=self.maximum.tolist(),
+            mean=self._missing_to_nan(self.mean).tolist(),
+            stdev=self.stdev.tolist(),
+        )
@@ -9,6 +9,7 @@
 # nor does it submit to any jurisdiction.
 #
 
+import numpy as np
 import pytest
 
 import climetlab as cml
@@ -39,6 +40,39 @@ def test_numpy_xarray():
     cml.plot_map(x.msl.values, metadata=x.msl)
 
 
+def test_grib_to_numpy():
+    s = cml.load_source("file", climetlab_file("docs/examples/test.grib"))
+
+    x = s.to_numpy()
+    assert x.shape == (2, 11, 19)
+    assert x.dtype == np.float64
+    assert np.array_equal(x[1], s[1].to_numpy())
+
+    y = s.to_numpy(dtype=np.float32)
+    assert y.dtype == np.float32
+    assert np.array_equal(y, x.astype(np.float32))
+
+    z = s.sel(param="nothing").to_numpy()
+    assert z.shape == (0,)
+
+
+def test_grib_to_numpy_threads():
+    s = cml.load_source("file", climetlab_file("docs/examples/test4.grib"))
+    x = s.to_numpy(dtype=np.float32)
+    t = s.to_xarray().t.values
+
+    with cml.settings.temporary("number-of-decode-threads", 3):
+        assert np.array_equal(s.to_numpy(dtype=np.float32), x)
+        assert [f.offset for f in s] == [f.offset for f in s._iter_lazy()]
+        fields = list(s)
+        # The values are decoded by the caller, in the requested dtype
+        assert all(f._values is None for f in fields)
+        assert np.array_equal(
+            np.stack([f.to_numpy(dtype=np.float32) for f in fields]), x
+        )
+        assert np.array_equal(s.to_xarray().t.values, t)
+
+
 if __name__ == "__main__":
     from climetlab.testing import main
 
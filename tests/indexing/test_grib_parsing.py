@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+
+# (C) Copyright 2023 ECMWF.
+#
+# This software is licensed under the terms of the Apache Licence Version 2.0
+# which can be obtained at http://www.apache.org/licenses/LICENSE-2.0.
+# In applying this licence, ECMWF does not waive the privileges and immunities
+# granted to it by virtue of its status as an intergovernmental organisation
+# nor does it submit to any jurisdiction.
+#
+
+import multiprocessing
+import os
+import shutil
+
+import pytest
+
+from climetlab.core.temporary import temp_directory
+from climetlab.indexing.database.sql import SqlDatabase
+from climetlab.readers.grib.parsing import GribIndexingDirectoryParserIterator
+from climetlab.testing import climetlab_file
+
+
+def _directory(tmpdir, n):
+    for i in range(n):
+        shutil.copy(
+            climetlab_file("docs/examples/test.grib"),
+            os.path.join(tmpdir, f"data-{i}.grib"),
+        )
+
+
+def _parser(tmpdir, **kwargs):
+    return GribIndexingDirectoryParserIterator(
+        tmpdir,
+        db_path=os.path.join(tmpdir, "climetlab.db"),
+        ignore=["climetlab*.db"],
+        relative_paths=True,
+        **kwargs,
+    )
+
+
+def test_grib_parsing_early_exit():
+    with temp_directory() as tmpdir:
+        _directory(tmpdir, 12)
+        parser = _parser(tmpdir, n_proc=2)
+        paths = parser.tasks
+
+        # The consumer stops while the workers are blocked on the output queue
+        iterator = parser._parse_paths(paths, 2)
+        next(iterator)
+        iterator.close()
+        assert not multiprocessing.active_children()
+
+        with pytest.raises(RuntimeError):
+            for path, entries in parser._parse_paths(paths, 2):
+                raise RuntimeError(path)
+        assert not multiprocessing.active_children()
+
+
+def test_grib_parsing_incremental():
+    with temp_directory() as tmpdir:
+        _directory(tmpdir, 3)
+        _parser(tmpdir, n_proc=1).load_database()
+
+        db = SqlDatabase(os.path.join(tmpdir, "climetlab.db"))
+        count = db.count()
+        assert sorted(db.paths_stats()) == ["data-0.grib", "data-1.grib", "data-2.grib"]
+
+        # Files that this scan does not find
+        db.set_paths_stats({"../other.grib": (1, 1.0), "ignored.grib": (1, 1.0)})
+
+        # Indexed by a version that did not record the files stats
+        db.connection.execute(
+            "UPDATE paths SET size=NULL, mtime=NULL WHERE key=?", ("data-1.grib",)
+        )
+        db.connection.commit()
+
+        os.unlink(os.path.join(tmpdir, "data-2.grib"))
+        parser = _parser(tmpdir, n_proc=1)
+        parser.ignore.append("ignored.grib")
+        parsed = []
+        parser.parse_path = lambda i, path: parsed.append(path)
+        parser.load_database()
+
+        # The stats are recorded without parsing the files again
+        assert parsed == []
+
+        stats = db.paths_stats()
+        assert sorted(stats) == [
+            "../other.grib",
+            "data-0.grib",
+            "data-1.grib",
+            "ignored.grib",
+        ]
+        st = os.stat(os.path.join(tmpdir, "data-1.grib"))
+        assert stats["data-1.grib"] == (st.st_size, st.st_mtime)
+        assert db.count() == count * 2 // 3
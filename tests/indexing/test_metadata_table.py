@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+# (C) Copyright 2023 ECMWF.
+#
+# This software is licensed under the terms of the Apache Licence Version 2.0
+# which can be obtained at http://www.apache.org/licenses/LICENSE-2.0.
+# In applying this licence, ECMWF does not waive the privileges and immunities
+# granted to it by virtue of its status as an intergovernmental organisation
+# nor does it submit to any jurisdiction.
+#
+
+
+import climetlab as cml
+from climetlab.testing import climetlab_file
+
+
+def _keys(ds):
+    return [(f.metadata("param"), f.metadata("level")) for f in ds]
+
+
+def test_metadata_table_same_as_per_field():
+    s = cml.load_source("file", climetlab_file("docs/examples/test4.grib"))
+    t = cml.load_source("file", climetlab_file("docs/examples/test4.grib"))
+    t = t.cache_metadata("param", "levelist", progress_bar=False)
+
+    for kwargs in (
+        dict(param="t"),
+        dict(param=["t", "z"], level="850"),
+        dict(level=[500, 1000]),
+        dict(param=lambda x: x.startswith("z")),
+    ):
+        assert _keys(s.sel(**kwargs)) == _keys(t.sel(**kwargs)), kwargs
+
+    for kwargs in (
+        dict(param="descending"),
+        dict(param=["z", "t"], level="descending"),
+        dict(level="ascending", param="ascending"),
+    ):
+        assert _keys(s.order_by(**kwargs)) == _keys(t.order_by(**kwargs)), kwargs
+
+    assert s.unique_values("param", "levelist", progress_bar=False) == (
+        t.unique_values("param", "levelist")
+    )
+
+
+def test_metadata_table_chaining():
+    s = cml.load_source("file", climetlab_file("docs/examples/test4.grib"))
+    s = s.cache_metadata("param", "levelist", progress_bar=False)
+
+    r = s.order_by(level="descending").sel(param="z")
+    assert r._metadata_table.columns["param"].tolist() == ["z", "z"]
+    assert _keys(r) == [("z", 850), ("z", 500)]
+
+    assert _keys(s.isel(param=0)) == _keys(s.sel(param="t"))
+    assert _keys(s.isel(param=1, level=[1])) == [("z", 850)]
+    assert len(s.isel(level=slice(0, 2))) == 4
+
+
+if __name__ == "__main__":
+    from climetlab.testing import main
+
+    main(__file__)
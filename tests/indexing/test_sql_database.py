@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+
+# (C) Copyright 2023 ECMWF.
+#
+# This software is licensed under the terms of the Apache Licence Version 2.0
+# which can be obtained at http://www.apache.org/licenses/LICENSE-2.0.
+# In applying this licence, ECMWF does not waive the privileges and immunities
+# granted to it by virtue of its status as an intergovernmental organisation
+# nor does it submit to any jurisdiction.
+#
+
+import os
+import sqlite3
+
+import pytest
+
+from climetlab.core.temporary import temp_directory
+from climetlab.indexing.database.sql import (
+    EntriesLoader,
+    SqlDatabase,
+    SqlMaterialisation,
+    SqlOrder,
+    SqlRemapping,
+    SqlSelection,
+)
+
+
+def _entries(n):
+    entries = [
+        dict(_path="data.grib", _offset=i * 10, _length=10, param="t", levelist=i)
+        for i in range(n)
+    ]
+    # A column that only appears late in the iterator
+    entries[-2]["number"] = 3
+    return entries
+
+
+def test_sql_bulk_load(monkeypatch):
+    monkeypatch.setattr(EntriesLoader, "BATCH_SIZE", 4)
+
+    with temp_directory() as tmpdir:
+        db = SqlDatabase(os.path.join(tmpdir, "index.db"))
+        assert db.load_iterator(_entries(10)) == 10
+        assert db.count() == 10
+        assert db.already_loaded("data.grib", None)
+
+        dicts = list(db.lookup_dicts())
+        assert [d["levelist"] for d in dicts] == list(range(10))
+        assert [d.get("number") for d in dicts] == [None] * 8 + [3, None]
+
+        # The pragmas are restored after loading
+        (mode,) = db.connection.execute("PRAGMA journal_mode;").fetchone()
+        assert mode == "delete"
+
+
+def test_sql_bulk_load_rollback(monkeypatch):
+    monkeypatch.setattr(EntriesLoader, "BATCH_SIZE", 4)
+
+    def failing():
+        yield from _entries(10)[:6]
+        raise RuntimeError("Parsing failed")
+
+    with temp_directory() as tmpdir:
+        db = SqlDatabase(os.path.join(tmpdir, "index.db"))
+        with pytest.raises(RuntimeError):
+            db.load_iterator(failing())
+
+        # The first batch was rolled back, and the pragmas restored
+        assert db.count() == 0
+        assert not db.paths_stats()
+        (mode,) = db.connection.execute("PRAGMA journal_mode;").fetchone()
+        assert mode == "delete"
+
+        assert db.load_iterator(_entries(10)) == 10
+        assert db.count() == 10
+
+
+def test_sql_paths_stats():
+    with temp_directory() as tmpdir:
+        db = SqlDatabase(os.path.join(tmpdir, "index.db"))
+        entries = _entries(4)
+        for e in entries[2:]:
+            e["_path"] = "other.grib"
+        db.load_iterator(entries)
+
+        db.set_paths_stats({"data.grib": (100, 1.5), "empty.grib": (0, 2.5)})
+        assert db.paths_stats() == {
+            "data.grib": (100, 1.5),
+            "other.grib": (None, None),
+            "empty.grib": (0, 2.5),
+        }
+
+        db.remove_paths(["data.grib", "empty.grib"])
+        assert db.count() == 2
+        assert list(db.paths_stats()) == ["other.grib"]
+
+
+def test_sql_indexes_do_not_change_order():
+    with temp_directory() as tmpdir:
+        db = SqlDatabase(os.path.join(tmpdir, "index.db"))
+        # Entries not in (path, offset) order
+        entries = []
+        for i, path in enumerate(["c.grib", "a.grib", "b.grib"]):
+            for level in (850, 500):
+                entries.append(
+                    dict(
+                        _path=path,
+                        _offset=level,
+                        _length=10,
+                        param="t",
+                        levelist=level,
+                        date=20000101 + i,
+                        time=0,
+                    )
+                )
+        db.load_iterator(entries)
+        db.build_indexes()
+
+        names = [r[1] for r in db.connection.execute("PRAGMA index_list(entries);")]
+        assert "path_offset_length_index" in names
+        assert "i_param_i_levelist_i_date_i_time_composite_index" in names
+
+        def check(db):
+            parts = [(p.path, p.offset) for p in db.lookup_parts(resolve_paths=False)]
+            dicts = [(d["_path"], d["_offset"]) for d in db.lookup_dicts()]
+            assert parts == dicts
+            return parts
+
+        assert check(db) == [(e["_path"], e["_offset"]) for e in entries]
+
+        selection = db.filter(SqlSelection(dict(param="t", levelist=500)))
+        assert check(selection) == [("c.grib", 500), ("a.grib", 500), ("b.grib", 500)]
+
+        ordered = db.filter(SqlOrder(dict(levelist="ascending")))
+        assert check(ordered) == [
+            ("c.grib", 500),
+            ("a.grib", 500),
+            ("b.grib", 500),
+            ("c.grib", 850),
+            ("a.grib", 850),
+            ("b.grib", 850),
+        ]
+
+
+def test_sql_paging():
+    with temp_directory() as tmpdir:
+        path = os.path.join(tmpdir, "index.db")
+        db = SqlDatabase(path)
+        db.load_iterator(_entries(10))
+
+        for db, expected in (
+            (db, list(range(10))),
+            (db.filter(SqlOrder(dict(levelist="descending"))), list(range(10))[::-1]),
+        ):
+
+            def page(offset):
+                return [d["levelist"] for d in db.lookup_dicts(limit=4, offset=offset)]
+
+            # In sequence, and in random order
+            assert page(0) + page(4) + page(8) == expected
+            assert page(4) == expected[4:8]
+            assert page(0) == expected[0:4]
+            assert page(8) == expected[8:]
+
+            # No lock is kept on the database between pages
+            page(0)
+            other = sqlite3.connect(path, timeout=0)
+            other.execute("BEGIN EXCLUSIVE")
+            other.rollback()
+            other.close()
+
+        # Sequential pages of a view ordered by rowid start after the previous one
+        db = SqlDatabase(path)
+        assert [d["levelist"] for d in db.lookup_dicts(limit=4, offset=0)] == [
+            0,
+            1,
+            2,
+            3,
+        ]
+        assert list(db._connection.pages.values()) == [(4, 4)]
+
+
+def test_sql_materialisation():
+    with temp_directory() as tmpdir:
+        db = SqlDatabase(os.path.join(tmpdir, "index.db"))
+        db.load_iterator(_entries(10))
+
+        def levels(db):
+            return [d["levelist"] for d in db.lookup_dicts()]
+
+        db = db.filter(SqlSelection(dict(levelist=[1, 3, 4, 6, 8])))
+        db = db.filter(SqlOrder(dict(levelist="descending")))
+        m = db.filter(SqlMaterialisation())
+
+        assert levels(m) == levels(db) == [8, 6, 4, 3, 1]
+        assert m.count() == 5
+        assert [p.offset for p in m.lookup_parts(resolve_paths=False)] == [
+            80,
+            60,
+            40,
+            30,
+            10,
+        ]
+
+        s = m.filter(SqlSelection(dict(levelist=[1, 6, 8])))
+        assert levels(s) == [8, 6, 1]
+        assert s.unique_values("levelist") == {"i_levelist": [8, 6, 1]}
+
+
+def test_sql_materialisation_after_remapping():
+    with temp_directory() as tmpdir:
+        db = SqlDatabase(os.path.join(tmpdir, "index.db"))
+        db.load_iterator(_entries(4))
+
+        # The remapping replaces an existing column
+        r = db.filter(SqlRemapping(remapping=dict(param="{param}{levelist}")))
+        assert [d["param"] for d in r.lookup_dicts()] == ["t0", "t1", "t2", "t3"]
+        s = r.filter(SqlSelection(dict(param="t2")))
+        assert [d["levelist"] for d in s.lookup_dicts()] == [2]
+
+        m = r.filter(SqlOrder(dict(levelist="descending")))
+        m = m.filter(SqlMaterialisation())
+        assert [d["param"] for d in m.lookup_dicts()] == ["t3", "t2", "t1", "t0"]
+
+        s = m.filter(SqlSelection(dict(param=["t0", "t2"])))
+        assert [d["levelist"] for d in s.lookup_dicts()] == [2, 0]
+
+
+def test_sql_order_by_list():
+    with temp_directory() as tmpdir:
+        db = SqlDatabase(os.path.join(tmpdir, "index.db"))
+        entries = _entries(6)
+        for e in entries:
+            e["param"] = ["t", "z", "o'clock"][e["levelist"] % 3]
+        db.load_iterator(entries)
+
+        order = db.filter(SqlOrder(dict(param=["z", "o'clock"], levelist=[4, 1])))
+        assert [(d["param"], d["levelist"]) for d in order.lookup_dicts()] == [
+            ("z", 4),
+            ("z", 1),
+            ("o'clock", 2),
+            ("o'clock", 5),
+            ("t", 0),
+            ("t", 3),
+        ]
+
+
+def test_sql_unique_values():
+    with temp_directory() as tmpdir:
+        db = SqlDatabase(os.path.join(tmpdir, "index.db"))
+        entries = _entries(6)
+        for e in entries:
+            e["step"] = 1.5 * (e["levelist"] % 2)
+        db.load_iterator(entries)
+
+        db = db.filter(SqlOrder(dict(levelist="descending")))
+        assert db.unique_values("levelist", "step", "number", "param") == {
+            "i_levelist": [5, 4, 3, 2, 1, 0],
+            "i_step": [1.5, 0.0],
+            "i_number": [None, 3],
+            "i_param": ["t"],
+        }
+
+
+def test_sql_unique_values_float_precision():
+    with temp_directory() as tmpdir:
+        db = SqlDatabase(os.path.join(tmpdir, "index.db"))
+        entries = _entries(3)
+        for e, step in zip(entries, (1 / 3, 0.1 + 0.2, 1 / 3)):
+            e["step"] = step
+        db.load_iterator(entries)
+
+        steps = db.unique_values("step")["i_step"]
+        assert steps == [1 / 3, 0.1 + 0.2]
+
+        s = db.filter(SqlSelection(dict(step=steps[0])))
+        assert [d["levelist"] for d in s.lookup_dicts()] == [0, 2]
+
+
+if __name__ == "__main__":
+    from climetlab.testing import main
+
+    main(__file__)
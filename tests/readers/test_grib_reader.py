@@ -10,11 +10,18 @@
 #
 
 import datetime
+import json
 import os
+import shutil
 
+import eccodes
+import numpy as np
 import pytest
 
-from climetlab import load_source, plot_map
+from climetlab import load_source, plot_map, settings
+from climetlab.core.caching import auxiliary_cache_file
+from climetlab.readers.grib.codes import get_messages_positions
+from climetlab.readers.grib.index.file import FieldSetInOneFile
 from climetlab.testing import NO_CDS, climetlab_file
 
 
@@ -65,6 +72,24 @@ def test_multi():
     source.to_xarray()
 
 
+def test_full_index_holes():
+    s = load_source("file", climetlab_file("docs/examples/test4.grib"))
+    s = s.order_by("param", "levelist")
+
+    # Drop ("z", 500)
+    full = s[(0, 1, 3)].full("param", "levelist")
+    assert len(full) == 4
+    assert full.holes.tolist() == [True, True, False, True]
+
+    assert [
+        (full[i].metadata("param"), full[i].metadata("level")) for i in (0, 1, 3)
+    ] == [
+        ("t", 500),
+        ("t", 850),
+        ("z", 850),
+    ]
+
+
 def test_dummy_grib():
     s = load_source(
         "climetlab-testing",
@@ -103,6 +128,134 @@ def test_bbox():
     assert s.to_bounding_box().as_tuple() == (73, -27, 33, 45), s.to_bounding_box()
 
 
+def test_messages_positions(tmp_path):
+    with open(climetlab_file("docs/examples/test.grib"), "rb") as f:
+        data = f.read()
+
+    offsets, lengths = get_messages_positions(climetlab_file("docs/examples/test.grib"))
+    assert offsets.tolist() == [0, 526]
+    assert lengths.tolist() == [526, 526]
+
+    # Padding, spurious markers and a truncated message are skipped
+    path = str(tmp_path / "padded.grib")
+    with open(path, "wb") as f:
+        f.write(data + b"\0" * 1000 + b"GRIBxx" + data + b"GRIB")
+
+    offsets, lengths = get_messages_positions(path)
+    assert offsets.tolist() == [0, 526, 2058, 2584]
+    assert lengths.tolist() == [526, 526, 526, 526]
+
+    s = load_source("file", path)
+    assert len(s) == 4
+    assert s[2].offset == 2058
+
+
+def test_to_numpy_float32():
+    s = load_source("file", climetlab_file("docs/examples/test.grib"))
+
+    x = s[0].to_numpy(dtype=np.float32)
+    assert x.dtype == np.float32
+    assert x.shape == (11, 19)
+    assert np.array_equal(x, s[0].to_numpy().astype(np.float32))
+
+    f = s[1]
+    assert f.to_numpy(dtype="float32", reshape=False).shape == (209,)
+    if hasattr(eccodes, "codes_get_float_array"):
+        # No float64 copy of the values was decoded
+        assert f._values is None
+
+
+@pytest.mark.parametrize("fallback", ["missing", "float64"])
+def test_to_numpy_float32_fallback(monkeypatch, fallback):
+    s = load_source("file", climetlab_file("docs/examples/test.grib"))
+    expected = s[0].to_numpy().astype(np.float32)
+
+    # Older versions of eccodes
+    calls = []
+    if fallback == "missing":
+        monkeypatch.delattr(eccodes, "codes_get_float_array", raising=False)
+    else:
+
+        def codes_get_float_array(handle, key):
+            calls.append(key)
+            return eccodes.codes_get_double_array(handle, key)
+
+        monkeypatch.setattr(
+            eccodes, "codes_get_float_array", codes_get_float_array, raising=False
+        )
+
+    f = s[0]
+    assert f._values is None
+    x = f.to_numpy(dtype=np.float32)
+    assert x.dtype == np.float32
+    assert np.array_equal(x, expected)
+    assert calls == ([] if fallback == "missing" else ["values"])
+
+
+@pytest.mark.parametrize("version", [1, 2])
+def test_offsets_index_cache(tmp_path, version):
+    path = str(tmp_path / "test.grib")
+    shutil.copy(climetlab_file("docs/examples/test.grib"), path)
+
+    # Pre-existing JSON index is migrated to the binary format
+    json_cache = auxiliary_cache_file(
+        "grib-index", path, content="null", extension=".json"
+    )
+    with open(json_cache, "w") as f:
+        json.dump(dict(version=version, offsets=[0, 526], lengths=[526, 526]), f)
+
+    s = FieldSetInOneFile(path)
+    assert not os.path.exists(json_cache)
+    assert s.offsets.dtype == np.int64
+    assert s.offsets.tolist() == [0, 526]
+
+    with np.load(s.mappings_cache_file) as c:
+        assert int(c["version"]) == FieldSetInOneFile.VERSION
+        assert c["lengths"].tolist() == [526, 526]
+
+    s = FieldSetInOneFile(path)
+    assert s.lengths.tolist() == [526, 526]
+    assert len(s) == 2
+
+
+def test_offsets_index_cache_invalid(tmp_path):
+    path = str(tmp_path / "test.grib")
+    shutil.copy(climetlab_file("docs/examples/test.grib"), path)
+
+    # A JSON index that does not match the messages of the file is not migrated
+    json_cache = auxiliary_cache_file(
+        "grib-index", path, content="null", extension=".json"
+    )
+    with open(json_cache, "w") as f:
+        json.dump(dict(version=1, offsets=[0, 500], lengths=[526, 552]), f)
+
+    s = FieldSetInOneFile(path)
+    assert not os.path.exists(json_cache)
+    assert s.offsets.tolist() == [0, 526]
+    assert s.lengths.tolist() == [526, 526]
+
+
+def test_statistics(tmp_path):
+    path = str(tmp_path / "test4.grib")
+    shutil.copy(climetlab_file("docs/examples/test4.grib"), path)
+
+    s = load_source("file", path)
+    values = np.concatenate([f.values for f in s])
+
+    with settings.temporary("number-of-decode-threads", 3):
+        stats = s.statistics()
+
+    assert stats["count"] == 4
+    assert stats["minimum"] == values.min()
+    assert stats["maximum"] == values.max()
+    assert np.isclose(stats["average"], values.mean())
+    assert np.isclose(stats["stdev"], values.std())
+
+    # From the cache
+    assert load_source("file", path).statistics() == stats
+    assert load_source("file", path).sel(param="t").statistics()["count"] == 2
+
+
 if __name__ == "__main__":
     from climetlab.testing import main
 
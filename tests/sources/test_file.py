@@ -16,7 +16,7 @@ import sys
 
 import pytest
 
-from climetlab import load_source
+from climetlab import load_source, settings
 from climetlab.core.temporary import temp_directory
 from climetlab.testing import climetlab_file
 
@@ -79,6 +79,23 @@ def test_glob():
         assert len(s) == 4, len(s)
 
 
+def test_parallel_scan():
+    s = load_source("file", climetlab_file("docs/examples/test.grib"))
+    with temp_directory() as tmpdir:
+        for i in range(6):
+            s.save(os.path.join(tmpdir, f"{i}.grib"))
+        with open(os.path.join(tmpdir, "readme.txt"), "w") as f:
+            f.write("Not a GRIB file")
+
+        with settings.temporary("number-of-scan-threads", 4):
+            s = load_source("file", os.path.join(tmpdir, "*.grib"))
+            assert len(s) == 12, len(s)
+
+            s = load_source("file", tmpdir, filter="*.grib")
+            assert len(s) == 12, len(s)
+            assert s[11].offset == 526
+
+
 if __name__ == "__main__":
     from climetlab.testing import main
 
@@ -167,6 +167,27 @@ def test_multi_grib():
     ds.statistics()
 
 
+def test_multi_grib_random_access():
+    dates = [20000101 + i for i in range(5)]
+    ds = load_source(
+        "multi",
+        [
+            load_source("climetlab-testing", kind="grib", date=d, paramId=[129, 130])
+            for d in dates
+        ],
+    )
+    assert len(ds) == 10
+    assert ds.offsets == [0, 2, 4, 6, 8, 10]
+
+    expected = [(d, p) for d in dates for p in ("z", "t")]
+    for i in (7, 0, 9, 4, 3, -1, -10):
+        f = ds[i]
+        assert (f.metadata("date"), f.metadata("param")) == expected[i], i
+
+    with pytest.raises(IndexError):
+        ds[10]
+
+
 def test_multi_grib_mixed():
     ds = load_source(
         "multi",
@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+
+# (C) Copyright 2023 ECMWF.
+#
+# This software is licensed under the terms of the Apache Licence Version 2.0
+# which can be obtained at http://www.apache.org/licenses/LICENSE-2.0.
+# In applying this licence, ECMWF does not waive the privileges and immunities
+# granted to it by virtue of its status as an intergovernmental organisation
+# nor does it submit to any jurisdiction.
+#
+
+import itertools
+import json
+import os
+
+import numpy as np
+import pytest
+
+import climetlab as cml
+from climetlab.loaders import (
+    ChunkWriter,
+    HDF5Loader,
+    Ledger,
+    ZarrLoader,
+    load,
+    parse_part,
+    partition_range,
+)
+from climetlab.testing import MISSING, climetlab_file
+from climetlab.utils.stats import Statistics
+
+
+class RecordingArray:
+    def __init__(self, shape):
+        self.data = np.full(shape, np.nan)
+        self.writes = []
+
+    def __setitem__(self, key, value):
+        self.writes.append(key)
+        self.data[key] = value
+
+
+def test_chunk_writer():
+    data = np.random.rand(5, 3, 4)
+    target = RecordingArray((7, 3, 4))
+
+    writer = ChunkWriter(
+        target, data.shape, axis=0, chunk=3, offset=2, statistics_axis=1
+    )
+    for i, j in itertools.product(range(5), range(3)):
+        writer[i, j] = data[i, j]
+    writer.flush()
+
+    assert np.array_equal(target.data[2:], data)
+    assert np.isnan(target.data[:2]).all()
+
+    # One write per chunk row, aligned on the chunks of the target
+    assert [k[0] for k in target.writes] == [slice(2, 3), slice(3, 6), slice(6, 7)]
+
+    for j in range(3):
+        assert np.isclose(writer.statistics.mean[j], data[:, j].mean())
+        assert np.isclose(writer.statistics.stdev[j], data[:, j].std())
+
+    with pytest.raises(ValueError):
+        writer[0, 0] = data[0, 0]
+
+
+def test_chunk_writer_statistics_along_rows():
+    data = np.random.rand(5, 3, 4)
+    writer = ChunkWriter(
+        np.zeros(data.shape), data.shape, axis=0, chunk=2, statistics_axis=0
+    )
+    for i, j in itertools.product(range(5), range(3)):
+        writer[i, j] = data[i, j]
+    writer.flush()
+
+    assert writer.statistics.count.tolist() == [12] * 5
+    assert np.allclose(writer.statistics.mean, data.mean(axis=(1, 2)))
+
+
+def test_partition_range():
+    ranges = [partition_range(10, 3, i, 3) for i in (1, 2, 3)]
+    assert ranges == [(0, 3), (3, 6), (6, 10)]
+
+    # More partitions than chunks
+    ranges = [partition_range(4, 2, i, 3) for i in (1, 2, 3)]
+    assert ranges == [(0, 0), (0, 2), (2, 4)]
+
+    assert parse_part("2/3") == (2, 3)
+    with pytest.raises(ValueError):
+        parse_part("4/3")
+
+
+def test_ledger(tmp_path):
+    ledger = Ledger(str(tmp_path / "progress"), 3)
+    assert ledger.remaining() == [1, 2, 3]
+
+    data = np.random.rand(4, 3)
+    ledger.record(2, Statistics(axis=1, size=3).add(data[:2]))
+    ledger.record(1, Statistics(axis=1, size=3).add(data[2:]))
+    assert ledger.remaining() == [3]
+    assert not os.path.exists(str(tmp_path / "progress" / "part-3-of-3.npz"))
+
+    ledger.record(3, Statistics(axis=1, size=3))
+    assert ledger.remaining() == []
+
+    stats = Statistics(axis=1, size=3)
+    for s in Ledger(str(tmp_path / "progress"), 3).statistics(axis=1):
+        stats.merge(s)
+    assert stats.count.tolist() == [4, 4, 4]
+    assert np.allclose(stats.mean, data.mean(axis=0))
+    assert np.allclose(stats.minimum, data.min(axis=0))
+
+    # Partitions of another split are unrelated
+    assert Ledger(str(tmp_path / "progress"), 2).remaining() == [1, 2]
+
+
+def _config(**kwargs):
+    return dict(
+        input=dict(
+            source=dict(name="file", path=climetlab_file("docs/examples/test4.grib"))
+        ),
+        output=dict(
+            order=[dict(param=["t", "z"]), "levelist"],
+            statistics="param",
+            chunking=dict(param=1),
+            **kwargs,
+        ),
+    )
+
+
+@pytest.mark.skipif(MISSING("h5py"), reason="h5py not installed")
+def test_hdf5_loader_append(tmp_path):
+    import h5py
+
+    s = cml.load_source("file", climetlab_file("docs/examples/test4.grib"))
+    s.sel(param="t").save(str(tmp_path / "t.grib"))
+    s.sel(param="z").save(str(tmp_path / "z.grib"))
+    expected = s.order_by("param", "levelist").to_numpy()
+    expected = expected.reshape(2, 2, 181, 360).astype(np.float32)
+
+    def config(param):
+        return dict(
+            input=dict(source=dict(name="file", path=str(tmp_path / f"{param}.grib"))),
+            output=dict(
+                order=["param", "levelist"],
+                compression=dict(name="gzip", level=4, shuffle=True),
+            ),
+        )
+
+    path = str(tmp_path / "test.h5")
+    load(HDF5Loader(path), config("t"))
+
+    with h5py.File(path, mode="r") as f:
+        array = f["dataset"]
+        assert array.compression == "gzip" and array.shuffle
+        assert array.maxshape == (None, 2, 181, 360)
+        assert np.array_equal(array[:], expected[:1])
+
+    load(HDF5Loader(path), config("z"), append=True)
+
+    with h5py.File(path, mode="r") as f:
+        array = f["dataset"]
+        assert array.shape == (2, 2, 181, 360)
+        assert np.array_equal(array[:], expected)
+
+
+def test_auto_chunking():
+    s = cml.load_source("file", climetlab_file("docs/examples/test4.grib"))
+    cube = s.cube("param", "levelist")
+    assert cube.extended_user_shape == (2, 2, 181, 360)
+
+    step = -(-2 * 181 * 360 * 4 // 1024)  # In kilobytes
+    assert cube.chunking(f"{2 * step}K") == (2, 2, 181, 360)
+    assert cube.chunking(f"{step}K") == (1, 2, 181, 360)
+    assert cube.chunking(f"{step}K", dtype="float64") == (1, 2, 181, 180)
+    assert cube.chunking("auto") == (2, 2, 181, 360)
+    assert cube.chunking(dict(levelist=1)) == (2, 1)
+
+
+@pytest.mark.skipif(MISSING("zarr"), reason="zarr not installed")
+def test_zarr_loader_compression(tmp_path):
+    import zarr
+
+    path = str(tmp_path / "test.zarr")
+    config = _config(
+        compression=dict(name="blosc", cname="zstd", level=3, shuffle="bit")
+    )
+    config["output"]["chunking"] = "auto"
+
+    load(ZarrLoader(path), config)
+
+    z = zarr.open(path, mode="r")
+    assert z.chunks == (2, 2, 181, 360)
+    assert "zstd" in str(z.compressors if hasattr(z, "compressors") else z.compressor)
+
+    with pytest.raises(ValueError):
+        load(ZarrLoader(path), _config(compression="foo"))
+
+
+@pytest.mark.skipif(MISSING("zarr"), reason="zarr not installed")
+def test_zarr_loader_append(tmp_path):
+    import zarr
+
+    s = cml.load_source("file", climetlab_file("docs/examples/test4.grib"))
+    expected = s.order_by("param", "levelist").to_numpy()
+    expected = expected.reshape(2, 2, 181, 360).astype(np.float32)
+
+    def config(param):
+        s.sel(param=param).save(str(tmp_path / f"{param}.grib"))
+        return dict(
+            input=dict(source=dict(name="file", path=str(tmp_path / f"{param}.grib"))),
+            output=dict(order=["param", "levelist"], statistics="levelist"),
+        )
+
+    path = str(tmp_path / "test.zarr")
+    load(ZarrLoader(path), config("t"))
+    load(ZarrLoader(path), config("z"), append=True)
+
+    z = zarr.open(path, mode="r")
+    assert np.array_equal(z[:], expected)
+
+    metadata = z.attrs["climetlab"]
+    assert metadata["coords"] == dict(param=["t", "z"], levelist=[500, 850])
+    assert list(metadata["name_to_index"]) == ["500", "850"]
+    statistics = metadata["statistics_by_index"]
+    assert statistics["count"] == [2 * 181 * 360] * 2
+    assert np.allclose(statistics["mean"], expected.mean(axis=(0, 2, 3)))
+    assert np.allclose(statistics["minimum"], expected.min(axis=(0, 2, 3)))
+
+    with pytest.raises(ValueError, match="already loaded"):
+        load(ZarrLoader(path), config("z"), append=True)
+
+
+@pytest.mark.skipif(MISSING("zarr"), reason="zarr not installed")
+def test_zarr_loader_interrupted_append(tmp_path, monkeypatch):
+    import zarr
+
+    s = cml.load_source("file", climetlab_file("docs/examples/test4.grib"))
+    expected = s.order_by("param", "levelist").to_numpy()
+    expected = expected.reshape(2, 2, 181, 360).astype(np.float32)
+
+    def config(param):
+        s.sel(param=param).save(str(tmp_path / f"{param}.grib"))
+        return dict(
+            input=dict(source=dict(name="file", path=str(tmp_path / f"{param}.grib"))),
+            output=dict(order=["param", "levelist"], statistics="levelist"),
+        )
+
+    path = str(tmp_path / "test.zarr")
+    load(ZarrLoader(path), config("t"))
+
+    def interrupted(self, key, value):
+        raise KeyboardInterrupt()
+
+    with monkeypatch.context() as m:
+        m.setattr(ChunkWriter, "__setitem__", interrupted)
+        with pytest.raises(KeyboardInterrupt):
+            load(ZarrLoader(path), config("z"), append=True)
+
+    # The array was extended, but the step was not recorded
+    assert zarr.open(path, mode="r").shape == (2, 2, 181, 360)
+
+    with pytest.warns(UserWarning, match="interrupted append"):
+        load(ZarrLoader(path), config("z"), append=True)
+
+    z = zarr.open(path, mode="r")
+    assert np.array_equal(z[:], expected)
+    assert z.attrs["climetlab"]["coords"]["param"] == ["t", "z"]
+    statistics = z.attrs["climetlab"]["statistics_by_index"]
+    assert statistics["count"] == [2 * 181 * 360] * 2
+
+
+def _read_target(loader, path):
+    if isinstance(loader, ZarrLoader):
+        import zarr
+
+        z = zarr.open(path, mode="r")
+        return z[:], dict(z.attrs["climetlab"])
+
+    import h5py
+
+    with h5py.File(path, mode="r") as f:
+        array = f["dataset"]
+        return array[:], json.loads(array.attrs["climetlab"])
+
+
+@pytest.mark.parametrize(
+    "loader,suffix",
+    [
+        pytest.param(
+            ZarrLoader,
+            "zarr",
+            marks=pytest.mark.skipif(MISSING("zarr"), reason="zarr not installed"),
+        ),
+        pytest.param(
+            HDF5Loader,
+            "h5",
+            marks=pytest.mark.skipif(MISSING("h5py"), reason="h5py not installed"),
+        ),
+    ],
+)
+def test_loader_resume_parts(tmp_path, monkeypatch, loader, suffix):
+    reference = str(tmp_path / f"reference.{suffix}")
+    load(loader(reference), _config())
+    expected, expected_metadata = _read_target(loader(reference), reference)
+
+    path = str(tmp_path / f"test.{suffix}")
+    setitem = ChunkWriter.__setitem__
+    written = []
+
+    def interrupted(self, key, value):
+        # Interrupted in the middle of the second partition
+        if len(written) == 3:
+            raise KeyboardInterrupt()
+        written.append(key)
+        setitem(self, key, value)
+
+    with monkeypatch.context() as m:
+        m.setattr(ChunkWriter, "__setitem__", interrupted)
+        with pytest.raises(KeyboardInterrupt):
+            load(loader(path), _config(), parts=2)
+
+    assert loader(path).ledger(2).remaining() == [2]
+
+    # Only the second partition is loaded again
+    written.clear()
+    load(loader(path), _config(), parts=2)
+
+    data, metadata = _read_target(loader(path), path)
+    assert np.array_equal(data, expected)
+    assert metadata["coords"] == expected_metadata["coords"]
+    for name, values in metadata["statistics_by_index"].items():
+        assert np.allclose(values, expected_metadata["statistics_by_index"][name])
+
+    with pytest.raises(ValueError, match="appending"):
+        load(loader(path), _config(), append=True, parts=2)
+
+
+@pytest.mark.skipif(MISSING("zarr"), reason="zarr not installed")
+def test_zarr_loader_threads(tmp_path):
+    import zarr
+
+    def read(path):
+        z = zarr.open(path, mode="r")
+        return z[:], z.attrs["climetlab"]["statistics_by_index"]
+
+    load(ZarrLoader(str(tmp_path / "sequential.zarr")), _config())
+    with cml.settings.temporary("number-of-decode-threads", 3):
+        load(ZarrLoader(str(tmp_path / "threaded.zarr")), _config())
+
+    expected, expected_statistics = read(str(tmp_path / "sequential.zarr"))
+    data, statistics = read(str(tmp_path / "threaded.zarr"))
+    assert np.array_equal(data, expected)
+    assert statistics == expected_statistics
+
+
+def _with_missing_values(path, target, n):
+    # Masks the first n points of the first field with a bitmap
+    import eccodes
+
+    with open(path, "rb") as f, open(target, "wb") as g:
+        first = True
+        while True:
+            h = eccodes.codes_grib_new_from_file(f)
+            if h is None:
+                break
+            if first:
+                values = eccodes.codes_get_values(h)
+                values[:n] = 9999
+                eccodes.codes_set(h, "missingValue", 9999)
+                eccodes.codes_set(h, "bitmapPresent", 1)
+                eccodes.codes_set_values(h, values)
+                first = False
+            eccodes.codes_write(h, g)
+            eccodes.codes_release(h)
+
+
+@pytest.mark.skipif(MISSING("zarr"), reason="zarr not installed")
+def test_zarr_loader_missing_values(tmp_path):
+    import zarr
+
+    path = str(tmp_path / "bitmap.grib")
+    _with_missing_values(climetlab_file("docs/examples/test4.grib"), path, 10)
+
+    config = _config()
+    config["input"]["source"]["path"] = path
+    load(ZarrLoader(str(tmp_path / "test.zarr")), config)
+
+    z = zarr.open(str(tmp_path / "test.zarr"), mode="r")
+    data = z[:]
+    assert np.isnan(data[0, 0].reshape(-1)[:10]).all()
+    assert not np.isnan(data.reshape(-1)[10:]).any()
+
+    # The missing values are not in the statistics
+    statistics = z.attrs["climetlab"]["statistics_by_name"]["t"]
+    assert statistics["count"] == 2 * 181 * 360 - 10
+    assert statistics["maximum"] < 9999
+    assert np.isclose(statistics["mean"], np.nanmean(data[0]))
+    assert np.isclose(statistics["sums"], np.nansum(data[0]), rtol=1e-6)
+    assert np.isclose(
+        statistics["squares"], np.nansum(data[0].astype(np.float64) ** 2), rtol=1e-6
+    )
+
+
+if __name__ == "__main__":
+    from climetlab.testing import main
+
+    main(__file__)
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+
+# (C) Copyright 2023 ECMWF.
+#
+# This software is licensed under the terms of the Apache Licence Version 2.0
+# which can be obtained at http://www.apache.org/licenses/LICENSE-2.0.
+# In applying this licence, ECMWF does not waive the privileges and immunities
+# granted to it by virtue of its status as an intergovernmental organisation
+# nor does it submit to any jurisdiction.
+#
+
+import numpy as np
+
+from climetlab.utils.stats import Statistics
+
+
+def test_statistics_merge():
+    rng = np.random.default_rng(42)
+    values = 1e6 + rng.standard_normal(10_000)
+    values[::7] = np.nan
+    valid = values[~np.isnan(values)]
+
+    stats = Statistics()
+    for chunk in np.array_split(values, 9):
+        stats.merge(Statistics().add(chunk))
+
+    assert stats.count == valid.size
+    assert np.isclose(stats.mean, valid.mean())
+    assert np.isclose(stats.stdev, valid.std())
+    assert stats.minimum == valid.min()
+    assert stats.maximum == valid.max()
+
+
+def test_statistics_axis():
+    values = np.arange(24, dtype=np.float64).reshape(2, 3, 4)
+    values[0, 1, 0] = np.nan
+    values[:, 2, :] = np.nan
+
+    stats = Statistics(axis=1, size=3).add(values[:1]).add(values[1:])
+
+    assert stats.count.tolist() == [8, 7, 0]
+    assert stats.minimum[0] == 0 and stats.maximum[0] == 15
+    assert np.isclose(stats.mean[1], np.nanmean(values[:, 1, :]))
+    assert np.isclose(stats.stdev[1], np.nanstd(values[:, 1, :]))
+
+    d = stats.as_dict()
+    assert d["count"] == [8, 7, 0]
+    assert np.isnan(d["mean"][2]) and np.isnan(d["minimum"][2])
+
+
+if __name__ == "__main__":
+    from climetlab.testing import main
+
+    main(__file__)
@@ -10,10 +10,11 @@
 #
 
 
+import threading
 import time
 from datetime import datetime, timedelta
 
-from climetlab.core.thread import SoftThreadPool
+from climetlab.core.thread import SoftThreadPool, ordered_map
 
 
 def test_thread():
@@ -53,6 +54,29 @@ def test_thread():
     assert futures[3].result() == 9
 
 
+def test_ordered_map():
+    def f(x):
+        time.sleep(0.01 * (x % 3))
+        return x * x
+
+    expected = [x * x for x in range(20)]
+    assert list(ordered_map(f, range(20), 1)) == expected
+    assert list(ordered_map(f, range(20), 4)) == expected
+    assert list(ordered_map(f, range(20), 4, lookahead=1)) == expected
+
+
+def test_ordered_map_nested():
+    def inner(x):
+        return threading.get_ident()
+
+    def outer(x):
+        return threading.get_ident(), set(ordered_map(inner, range(10), 4))
+
+    # The nested calls run in the thread of their caller
+    for ident, idents in ordered_map(outer, range(10), 4):
+        assert idents == {ident}
+
+
 if __name__ == "__main__":
     from climetlab.testing import main
 